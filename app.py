@@ -3,20 +3,29 @@
 启动命令: streamlit run app.py
 """
 
+import hashlib
+import json
 import logging
 import sys
+import threading
+import time
+import uuid
 import importlib
+import re
 import streamlit as st
 import pandas as pd
 from datetime import datetime
 
 # 强制重新加载模块，避免缓存问题
-for mod_name in ['services.screener', 'services.binance', 'services.dexscreener', 'services.tokenpocket']:
+for mod_name in ['services.screener', 'services.binance', 'services.dexscreener', 'services.tokenpocket', 'services.watcher']:
     if mod_name in sys.modules:
         importlib.reload(sys.modules[mod_name])
 
 from services.screener import TokenScreener, create_filter_criteria
-from database import DatabaseManager
+from database import DatabaseManager, JobQueue
+from services.profiling import RunProfiler, load_latest_summary
+from services.watcher import TokenWatcher, MemorySink
+from config import USE_JOB_QUEUE, PROFILE_ENABLED, WATCH_INTERVAL, WATCH_IDLE_TIMEOUT
 
 # 配置日志
 logging.basicConfig(
@@ -171,7 +180,7 @@ LIGHT_THEME_CSS = """
 
 def format_number(num) -> str:
     """格式化数字"""
-    if num is None:
+    if num is None or pd.isna(num):
         return "-"
     if num >= 1_000_000_000:
         return f"{num / 1_000_000_000:.1f}B"
@@ -195,8 +204,15 @@ st.set_page_config(
 st.markdown(LIGHT_THEME_CSS, unsafe_allow_html=True)
 
 
-def get_screener():
-    return TokenScreener()
+@st.cache_resource
+def get_db() -> DatabaseManager:
+    return DatabaseManager()
+
+
+def get_screener(profiler: RunProfiler = None, lane: str = "interactive"):
+    db = get_db()
+    job_queue = JobQueue(db) if USE_JOB_QUEUE else None
+    return TokenScreener(db, job_queue=job_queue, profiler=profiler, lane=lane)
 
 
 def init_session_state():
@@ -204,44 +220,326 @@ def init_session_state():
     if "results" not in st.session_state:
         # 尝试从数据库加载缓存
         try:
-            db = DatabaseManager()
-            cached = db.get_cached_results()
+            cached = get_db().get_cached_results()
             if cached and cached.get("results"):
-                st.session_state.results = cached["results"]
+                set_results(cached["results"])
                 st.session_state.last_update = cached.get("screened_at")
                 if isinstance(st.session_state.last_update, str):
                     from datetime import datetime
                     st.session_state.last_update = datetime.fromisoformat(st.session_state.last_update.replace("Z", "+00:00"))
             else:
-                st.session_state.results = []
+                set_results([])
                 st.session_state.last_update = None
         except Exception:
-            st.session_state.results = []
+            set_results([])
             st.session_state.last_update = None
     if "last_update" not in st.session_state:
         st.session_state.last_update = None
 
 
-def tokens_to_dataframe(tokens: list) -> pd.DataFrame:
-    """转换为 DataFrame"""
-    if not tokens:
-        return pd.DataFrame()
+# 结果表列定义: (列名, 源字段)
+RESULT_COLUMNS = [
+    ("代币", "symbol"),
+    ("价格", "price"),
+    ("市值", "market_cap"),
+    ("前二十", "top20_holders_pct"),
+    ("币安量", "binance_volume_24h"),
+]
+
+def _streamlit_version() -> tuple:
+    return tuple(int(part) for part in re.findall(r"\d+", st.__version__)[:2])
+
+
+# 金额列的显示格式：支持预设格式的 Streamlit 以 K/M/B 显示，否则退回 printf 格式
+MONEY_FORMAT = "compact" if _streamlit_version() >= (1, 43) else "$%.0f"
+MONEY_CHANGE_FORMAT = "compact" if _streamlit_version() >= (1, 43) else "%+.0f"
+
+# 表格列显示格式（数值列保持数值类型，仅在前端格式化）
+RESULT_COLUMN_CONFIG = {
+    "价格": st.column_config.NumberColumn("价格", format="$%.6f"),
+    "市值": st.column_config.NumberColumn("市值", format=MONEY_FORMAT),
+    "前二十": st.column_config.NumberColumn("前二十", format="%.1f%%"),
+    "币安量": st.column_config.NumberColumn("币安量", format=MONEY_FORMAT),
+}
+
+PAGE_SIZES = [50, 100, 200, 500]
+
+
+def results_hash(tokens: list) -> str:
+    """计算结果列表的内容哈希，用作表格缓存键"""
+    payload = json.dumps(tokens or [], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
 
-    data = []
-    for token in tokens:
-        t = token if isinstance(token, dict) else token
-        top20 = t.get("top20_holders_pct")
-        price = t.get("price") or 0
+def set_results(tokens: list):
+    """更新会话中的结果及其内容哈希"""
+    st.session_state.results = tokens
+    st.session_state.results_hash = results_hash(tokens)
 
-        data.append({
-            "代币": t.get("symbol", "-"),
-            "价格": f"${price:.6f}" if price < 1 else f"${price:.4f}",
-            "市值": format_number(t.get("market_cap")),
-            "前二十": f"{top20:.1f}%" if top20 is not None else "-",
-            "币安量": format_number(t.get("binance_volume_24h")),
-        })
 
-    return pd.DataFrame(data)
+def tokens_to_dataframe(tokens: list) -> pd.DataFrame:
+    """转换为 DataFrame（向量化，数值列保持数值类型）"""
+    if not tokens:
+        return pd.DataFrame(columns=[name for name, _ in RESULT_COLUMNS])
+
+    fields = [field for _, field in RESULT_COLUMNS]
+    raw = pd.DataFrame.from_records(tokens, columns=fields)
+
+    df = pd.DataFrame({"代币": raw["symbol"].fillna("-").astype(str)})
+    for name, field in RESULT_COLUMNS[1:]:
+        df[name] = pd.to_numeric(raw[field], errors="coerce")
+    df["价格"] = df["价格"].fillna(0.0)
+    return df
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def cached_dataframe(content_hash: str, sort_by: str, ascending: bool, _tokens: list) -> pd.DataFrame:
+    """按内容哈希缓存排序后的结果表，无关控件触发的重跑不再重建"""
+    df = tokens_to_dataframe(_tokens)
+    if sort_by in df.columns:
+        df = df.sort_values(sort_by, ascending=ascending, na_position="last", kind="stable")
+    return df.reset_index(drop=True)
+
+
+def profile_table_build(tokens: list, content_hash: str):
+    """每份新结果只分析一次结果表构建（绕过缓存，测量实际开销）
+
+    结果来自本会话刚执行的筛选时计入该次运行，否则（离线筛选、读取缓存结果）单独作为一次运行。
+    """
+    profiler = st.session_state.get("profiler")
+    if profiler is None or st.session_state.get("profiler_results_hash") != content_hash:
+        profiler = RunProfiler()
+        st.session_state.profiler = profiler
+        st.session_state.profiler_results_hash = content_hash
+    with profiler.stage("tokens_to_dataframe"):
+        tokens_to_dataframe(tokens)
+    profiler.save()
+    st.session_state.profiled_table_hash = content_hash
+
+
+def render_results_table(tokens: list):
+    """分页 + 服务端排序渲染结果表"""
+    content_hash = st.session_state.get("results_hash") or results_hash(tokens)
+    column_names = [name for name, _ in RESULT_COLUMNS]
+
+    c1, c2, c3, c4 = st.columns([2, 1, 1, 1])
+    with c1:
+        sort_by = st.selectbox("排序", column_names, index=2, key="table_sort_by")
+    with c2:
+        ascending = st.selectbox("顺序", ["降序", "升序"], index=0, key="table_order") == "升序"
+    with c3:
+        page_size = st.selectbox("每页", PAGE_SIZES, index=0, key="table_page_size")
+
+    if st.session_state.get("profiling") and st.session_state.get("profiled_table_hash") != content_hash:
+        profile_table_build(tokens, content_hash)
+    df = cached_dataframe(content_hash, sort_by, ascending, tokens)
+    total_pages = max(1, -(-len(df) // page_size))
+    with c4:
+        page = st.number_input("页码", min_value=1, max_value=total_pages, value=1, step=1, key="table_page")
+
+    start = (int(page) - 1) * page_size
+    st.dataframe(
+        df.iloc[start:start + page_size],
+        use_container_width=True,
+        hide_index=True,
+        height=450,
+        column_config=RESULT_COLUMN_CONFIG,
+    )
+    st.caption(f"共 {len(df)} 条 · 第 {int(page)}/{total_pages} 页")
+
+
+def expect_saved_results(db):
+    """提交筛选结果前记录当前最新的结果 id，写入完成（出现更新的 id）之前不展示旧的变化"""
+    try:
+        st.session_state.changes_after_id = db.get_latest_history_id() or 0
+        st.session_state.changes_failed_count = len(db.writer.failed) if db.writer is not None else 0
+    except Exception:
+        st.session_state.pop("changes_after_id", None)
+
+
+def results_pending(db) -> bool:
+    """本会话提交的筛选结果是否仍在异步写入队列中（不等待写入）"""
+    after_id = st.session_state.get("changes_after_id")
+    if after_id is None:
+        return False
+    if (db.get_latest_history_id() or 0) > after_id:
+        st.session_state.pop("changes_after_id", None)
+        return False
+    if db.writer is not None and len(db.writer.failed) > st.session_state.get("changes_failed_count", 0):
+        st.session_state.pop("changes_after_id", None)
+        st.warning(f"筛选结果未能保存到数据库：{db.writer.last_error}")
+        return True
+    return True
+
+
+def render_changes_pending():
+    """等待本会话的筛选结果写入，写入后重跑页面展示变化"""
+    if not results_pending(get_db()):
+        st.rerun()
+    st.caption("筛选结果保存中，稍后显示与上次的变化…")
+
+
+# 写入完成后自动刷新（需要支持 st.fragment 的 Streamlit 版本，否则下次操作时显示）
+if hasattr(st, "fragment"):
+    render_changes_pending = st.fragment(run_every=1)(render_changes_pending)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def cached_changes(history_id: int):
+    """按结果 id 缓存展开后的变化：已保存的结果不会再改变，排序、翻页等重跑无需重建上一次的结果"""
+    return get_db().get_changes(history_id)
+
+
+def render_changes():
+    """展示最近一次筛选相对上一次的变化"""
+    db = get_db()
+    try:
+        # 刚提交的筛选结果可能还在异步写入队列中，此时最新的变化还是上一次的，先不展示
+        if results_pending(db):
+            if st.session_state.get("changes_after_id") is not None:
+                render_changes_pending()
+            return
+        history_id = db.get_latest_history_id()
+        changes = cached_changes(history_id) if history_id is not None else None
+    except Exception:
+        return
+    if not changes or not changes.get("delta"):
+        return
+
+    delta = changes["delta"]
+    entered, exited, changed = delta.get("entered", []), delta.get("exited", []), delta.get("changed", [])
+
+    with st.expander(f"与上次筛选相比: 新进入 {len(entered)} · 移出 {len(exited)} · 变化 {len(changed)}"):
+        if entered:
+            st.markdown("**新进入**")
+            st.dataframe(
+                tokens_to_dataframe(entered),
+                use_container_width=True,
+                hide_index=True,
+                column_config=RESULT_COLUMN_CONFIG,
+            )
+        if exited:
+            st.markdown("**移出**")
+            st.write("、".join(item.get("symbol") or item["key"] for item in exited))
+        if changed:
+            st.markdown("**指标变化**")
+            rows = []
+            for item in changed:
+                row = {"代币": item.get("symbol") or item["key"]}
+                for name, field in RESULT_COLUMNS[1:]:
+                    change = item["fields"].get(field)
+                    row[name] = change.get("delta") if change else None
+                rows.append(row)
+            st.dataframe(
+                pd.DataFrame(rows),
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "价格": st.column_config.NumberColumn("价格变化", format="%+.6f"),
+                    "市值": st.column_config.NumberColumn("市值变化", format=MONEY_CHANGE_FORMAT),
+                    "前二十": st.column_config.NumberColumn("前二十变化", format="%+.1f"),
+                    "币安量": st.column_config.NumberColumn("币安量变化", format=MONEY_CHANGE_FORMAT),
+                },
+            )
+
+
+@st.cache_resource
+def get_watch_registry() -> dict:
+    """进程内共享的监控：相同筛选条件的会话共用一个 TokenWatcher"""
+    return {"lock": threading.Lock(), "watchers": {}}
+
+
+def update_watch(criteria, enabled: bool):
+    """启动 / 停止后台监控；筛选条件变化时切换到对应的监控
+
+    会话每次重跑都会 touch() 监控；标签页关闭后不再 touch，超过 WATCH_IDLE_TIMEOUT 监控自动停止。
+    """
+    registry = get_watch_registry()
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+    key = repr(criteria)
+    state = st.session_state.get("watch")
+
+    with registry["lock"]:
+        if state and (not enabled or state["key"] != key):
+            entry = registry["watchers"].get(state["key"])
+            if entry:
+                entry["sessions"].discard(session_id)
+                if not entry["sessions"]:
+                    entry["stop"].set()
+                    del registry["watchers"][state["key"]]
+            del st.session_state["watch"]
+            state = None
+        if not enabled:
+            return
+
+        entry = registry["watchers"].get(key)
+        if entry is None or not entry["watcher"].running:
+            sink = MemorySink()
+            watcher = TokenWatcher(criteria, [sink], get_screener(lane="scheduled"))
+            entry = {
+                "watcher": watcher,
+                "sink": sink,
+                "sessions": set(entry["sessions"]) if entry else set(),
+                "stop": watcher.start(WATCH_INTERVAL, idle_timeout=WATCH_IDLE_TIMEOUT),
+            }
+            registry["watchers"][key] = entry
+        entry["sessions"].add(session_id)
+        entry["watcher"].touch()
+        st.session_state.watch = {"key": key, "watcher": entry["watcher"], "sink": entry["sink"]}
+
+
+def render_watch_events():
+    """展示监控模式下的进入 / 移出事件"""
+    state = st.session_state.get("watch")
+    if not state:
+        return
+    watcher, sink = state["watcher"], state["sink"]
+    watcher.touch()
+    stats = watcher.last_tick_stats
+    st.markdown(
+        f"**监控中** · 第 {watcher.ticks} 个周期 · 当前满足条件 {len(watcher.passing)} 个"
+        + (f" · 本周期补充 {stats['market_lookups']} 个" if stats else "")
+    )
+    events = sink.recent()
+    if events:
+        df = pd.DataFrame(events)[["at", "type", "symbol", "market_cap", "top20_holders_pct", "binance_volume_24h"]]
+        df["type"] = df["type"].map({"enter": "进入", "exit": "移出"})
+        st.dataframe(
+            df.rename(columns={"at": "时间", "type": "事件", "symbol": "代币"}),
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "market_cap": st.column_config.NumberColumn("市值", format=MONEY_FORMAT),
+                "top20_holders_pct": st.column_config.NumberColumn("前二十", format="%.1f%%"),
+                "binance_volume_24h": st.column_config.NumberColumn("币安量", format=MONEY_FORMAT),
+            },
+        )
+
+
+# 监控事件面板定时自动刷新（需要支持 st.fragment 的 Streamlit 版本）
+if hasattr(st, "fragment"):
+    render_watch_events = st.fragment(run_every=10)(render_watch_events)
+
+
+def render_diagnostics():
+    """展示最近一次性能分析的各阶段热点函数和内存分配位置"""
+    profiler = st.session_state.get("profiler")
+    summary = profiler.summary() if profiler else load_latest_summary()
+    if not summary or not summary.get("stages"):
+        st.caption("暂无性能分析数据，开启「性能分析」后执行一次筛选")
+        return
+
+    with st.expander(f"性能诊断 · {summary['run_id']}"):
+        for stage in summary["stages"]:
+            st.markdown(
+                f"**{stage['stage']}** · 耗时 {stage['wall_time']:.3f}s · "
+                f"峰值内存 {format_number(stage['peak_memory'])}B"
+            )
+            c1, c2 = st.columns(2)
+            with c1:
+                st.dataframe(pd.DataFrame(stage["hot_functions"]), use_container_width=True, hide_index=True)
+            with c2:
+                st.dataframe(pd.DataFrame(stage["allocations"]), use_container_width=True, hide_index=True)
 
 
 def main():
@@ -285,28 +583,73 @@ def main():
         vol_mult = {"万": 10_000, "M": 1_000_000}
         min_binance = int(binance_vol * vol_mult[binance_unit])
 
+        st.divider()
+
+        # 前 K 模式
+        st.markdown("**只看前 N 个**")
+        c1, c2 = st.columns(2)
+        with c1:
+            top_k = st.number_input("N (0=全部)", min_value=0, value=0, step=10, key="top_k")
+        with c2:
+            rank_label = st.selectbox("排序依据", ["市值", "币安量"], index=0, key="rank_by")
+        rank_by = {"市值": "market_cap", "币安量": "binance_volume_24h"}[rank_label]
+
+        st.divider()
+        watching = st.toggle("监控模式", value=False, key="watching", help="后台持续刷新，代币进入 / 移出筛选结果时提示")
+        profiling = st.toggle("性能分析", value=PROFILE_ENABLED, key="profiling")
+
         st.divider()
         filter_btn = st.button("🔍 开始筛选", type="primary", use_container_width=True)
+        offline_btn = st.button("⚡ 离线筛选", use_container_width=True, help="直接查询本地数据库中最近一次刷新的数据")
 
     results = st.session_state.results
+    criteria = create_filter_criteria(
+        min_market_cap=min_cap,
+        max_market_cap=max_cap,
+        min_top20_holders_pct=min_top20,
+        min_binance_volume=min_binance,
+        check_binance=True,
+        top_k=int(top_k),
+        rank_by=rank_by,
+    )
+
+    update_watch(criteria, watching)
+    render_watch_events()
+
+    # 离线筛选：不请求上游 API
+    if offline_btn:
+        try:
+            db = get_db()
+            started = time.perf_counter()
+            results = db.query_tokens(criteria)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            set_results(results)
+            st.session_state.last_update = db.get_last_refresh_time()
+            st.session_state.offline_notice = f"离线筛选完成: {len(results)} 个代币，用时 {elapsed_ms:.1f} ms"
+            st.rerun()
+        except Exception as e:
+            st.error(f"离线筛选失败: {e}")
+
+    if st.session_state.get("offline_notice"):
+        st.info(st.session_state.pop("offline_notice"))
 
     # 筛选逻辑
     if filter_btn:
         with st.spinner("筛选中..."):
             try:
-                criteria = create_filter_criteria(
-                    min_market_cap=min_cap,
-                    max_market_cap=max_cap,
-                    min_top20_holders_pct=min_top20,
-                    min_binance_volume=min_binance,
-                    check_binance=True,
-                )
-                results = get_screener().fetch_and_filter(criteria, fetch_top20_holders=True)
-                st.session_state.results = results
+                profiler = RunProfiler() if profiling else None
+                st.session_state.profiler = profiler
+                results = get_screener(profiler).fetch_and_filter(criteria, fetch_top20_holders=True)
+                if profiler:
+                    profiler.save()
+                set_results(results)
+                st.session_state.profiler_results_hash = st.session_state.results_hash
                 st.session_state.last_update = datetime.now()
-                # 保存到数据库缓存
+                # 保存到数据库缓存（异步写入，不阻塞页面）
                 try:
-                    DatabaseManager().save_cached_results(results)
+                    db = get_db()
+                    expect_saved_results(db)
+                    db.submit_cached_results(results)
                 except Exception:
                     pass
                 st.success(f"完成! 共 {len(results)} 个代币")
@@ -318,8 +661,8 @@ def main():
 
     # 结果
     if st.session_state.results:
-        df = tokens_to_dataframe(st.session_state.results)
-        st.dataframe(df, use_container_width=True, hide_index=True, height=450)
+        render_results_table(st.session_state.results)
+        render_changes()
     else:
         st.markdown("""
             <div class="empty-state">
@@ -329,6 +672,9 @@ def main():
             </div>
         """, unsafe_allow_html=True)
 
+    if profiling:
+        render_diagnostics()
+
 
 if __name__ == "__main__":
     main()
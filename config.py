@@ -2,9 +2,17 @@
 加密货币选币系统配置文件
 """
 
+import os
+
 # 数据库配置
 DATABASE_URL = "sqlite:///crypto_selection.db"
 
+# 筛选历史：每隔多少次筛选保存一次完整快照（其余只保存增量）
+HISTORY_SNAPSHOT_INTERVAL = 20
+
+# 筛选历史：保留最近多少个快照周期
+HISTORY_KEEP_SNAPSHOTS = 5
+
 # DEXScreener API 配置
 DEXSCREENER_BASE_URL = "https://api.dexscreener.com"
 
@@ -13,3 +21,104 @@ REQUEST_TIMEOUT = 30
 
 # 代理配置（如需要代理，设置为 {"http": "http://127.0.0.1:7890", "https": "http://127.0.0.1:7890"}）
 PROXIES = None
+
+# 多进程补充数据：False 表示在当前进程内补充；True 表示通过 SQLite 任务队列交给 worker 进程
+# 需要另行启动 worker: python -m services.workers --processes 4
+USE_JOB_QUEUE = False
+
+# 任务租约时长（秒），worker 崩溃后租约过期的任务会被其他 worker 重新领取
+JOB_LEASE_SECONDS = 60
+
+# 单个任务最多尝试次数
+JOB_MAX_ATTEMPTS = 3
+
+# 筛选进程等待队列任务完成的最长时间（秒）
+JOB_WAIT_TIMEOUT = 600
+
+# 写入任务后在该时间内没有任何任务被领取，视为没有 worker 在运行，改为在当前进程内补充（秒）
+JOB_CLAIM_TIMEOUT = 10
+
+# 跨进程共享的上游 API 限流（每秒请求数）
+RATE_LIMITS = {
+    "dexscreener": 5.0,
+    "tokenpocket": 5.0,
+    "bsc_rpc": 10.0,
+}
+
+# 前 K 模式：每批补充的代币数
+TOP_K_BATCH_SIZE = 10
+
+# 前 K 模式：缓存市值估计的误差余量（0.5 表示实际市值可能比估计高 50%）
+TOP_K_ESTIMATE_MARGIN = 0.5
+
+# 性能分析：默认关闭，可通过环境变量 CRYPTO_SCREENER_PROFILE=1 或侧边栏开关开启
+PROFILE_ENABLED = os.environ.get("CRYPTO_SCREENER_PROFILE", "") == "1"
+
+# 性能分析结果目录
+PROFILE_DIR = os.environ.get("CRYPTO_SCREENER_PROFILE_DIR", "profiles")
+
+# 监控模式：周期（秒）
+WATCH_INTERVAL = 60
+
+# 监控模式：币安价格变动超过该比例时重新获取市值数据
+WATCH_PRICE_CHANGE_THRESHOLD = 0.02
+
+# 监控模式：市值 / 持仓数据的缓存有效期（秒）
+WATCH_MARKET_TTL = 15 * 60
+WATCH_HOLDERS_TTL = 6 * 60 * 60
+
+# 监控模式（界面）：超过该时长没有会话关注（如标签页已关闭）时自动停止后台监控（秒）
+WATCH_IDLE_TIMEOUT = 5 * 60
+
+# 供应量索引有效期（秒）：有效期内用 币安价格 × 供应量 本地计算市值，不再查询 DEXScreener
+SUPPLY_INDEX_TTL = 7 * 24 * 60 * 60
+
+# 离线筛选：只返回在最近一次刷新前该时长内更新过的代币，已下架或长期未刷新的旧数据不会出现（秒）
+OFFLINE_MAX_AGE = 60 * 60
+
+# 异步写入：代币数据和筛选结果由单一后台线程批量写入数据库，筛选请求无需等待提交
+WRITE_BEHIND = True
+
+# 异步写入：收集一批写入的最长等待时间（秒）和单批最大条数
+WRITE_BEHIND_BATCH_WINDOW = 0.2
+WRITE_BEHIND_MAX_BATCH = 50
+
+# 只读结果 HTTP 服务（python -m services.api_server）
+API_HOST = "127.0.0.1"
+API_PORT = 8600
+
+# 持仓集中度数据来源: "tokenpocket"（第三方接口）或 "bsc_logs"（从 BSC 节点的 Transfer 日志本地计算）
+HOLDER_BACKEND = "tokenpocket"
+
+# BSC JSON-RPC 节点
+BSC_RPC_URL = "https://bsc-dataseed.binance.org"
+
+# 首次回填 Transfer 日志的起始区块（None 表示用 eth_getCode 二分查找合约创建区块），以及每次 eth_getLogs 查询的区块跨度
+BSC_LOG_START_BLOCK = None
+BSC_LOG_BLOCK_RANGE = 5000
+
+# 只同步到 最新区块 - 确认数，避免链重组导致余额错误
+BSC_LOG_CONFIRMATIONS = 15
+
+# 筛选时最多内联同步的区块数；落后更多（或尚未回填）的代币交给 backfill 通道在后台回填
+BSC_LOG_INLINE_MAX_BLOCKS = 20000
+
+# 进程内补充数据调度：每个上游同时进行的请求数（同一进程内所有会话共享）
+ENRICHMENT_HOST_CONCURRENCY = {
+    "dexscreener": 5,
+    "tokenpocket": 5,
+    "bsc_rpc": 2,
+}
+
+# 优先级通道: interactive（界面筛选）有排队任务时总是先执行；
+# scheduled（监控模式）和 backfill（批量回填）按权重分享剩余并发
+ENRICHMENT_LANE_WEIGHTS = {
+    "scheduled": 3,
+    "backfill": 1,
+}
+
+# 每个上游为 interactive 保留的并发数（后台通道最多占用 并发数 - 保留数）
+ENRICHMENT_INTERACTIVE_RESERVED = 1
+
+# 币安合约元数据（exchangeInfo: 状态、合约类型、基础资产、乘数）缓存有效期（秒）
+CONTRACT_METADATA_TTL = 24 * 60 * 60
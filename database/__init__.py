@@ -1,4 +1,16 @@
-from .models import Base, Token, History
+from .models import Base, Token, History, EnrichmentJob, RateLimitBucket, HolderBalance, HolderIndexState
 from .operations import DatabaseManager
+from .job_queue import JobQueue, SharedRateLimiter
 
-__all__ = ["Base", "Token", "History", "DatabaseManager"]
+__all__ = [
+    "Base",
+    "Token",
+    "History",
+    "EnrichmentJob",
+    "RateLimitBucket",
+    "HolderBalance",
+    "HolderIndexState",
+    "DatabaseManager",
+    "JobQueue",
+    "SharedRateLimiter",
+]
@@ -0,0 +1,104 @@
+"""
+筛选结果增量（delta）计算与还原
+"""
+
+from typing import List, Dict, Any
+
+
+def result_key(row: Dict[str, Any]) -> str:
+    """结果行的唯一键：优先合约地址，缺失时退回币安交易对/符号"""
+    return row.get("address") or row.get("binance_symbol") or row.get("symbol") or ""
+
+
+# 增量格式版本：2 表示字段变化只保存新值，并在顺序改变时保存结果顺序
+DELTA_VERSION = 2
+
+
+def compute_delta(previous: List[Dict[str, Any]], current: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """计算两次筛选结果之间的差异：新进入、移出、字段变化（只保存还原所需的新值）"""
+    prev_map = {result_key(r): r for r in previous}
+    curr_map = {result_key(r): r for r in current}
+
+    entered = [row for key, row in curr_map.items() if key not in prev_map]
+    exited = [
+        {"key": key, "symbol": row.get("symbol")}
+        for key, row in prev_map.items()
+        if key not in curr_map
+    ]
+
+    changed = []
+    for key, row in curr_map.items():
+        old = prev_map.get(key)
+        if old is None:
+            continue
+        fields = {field: value for field, value in row.items() if field not in old or old[field] != value}
+        removed = [field for field in old if field not in row]
+        if fields or removed:
+            item = {"key": key, "symbol": row.get("symbol"), "fields": fields}
+            if removed:
+                item["removed"] = removed
+            changed.append(item)
+
+    delta = {"v": DELTA_VERSION, "entered": entered, "exited": exited, "changed": changed}
+    # 默认还原顺序：保留上次的顺序，新进入的追加在后；与本次顺序不同时保存本次顺序
+    default_order = [key for key in prev_map if key in curr_map] + [result_key(row) for row in entered]
+    current_order = list(curr_map)
+    if current_order != default_order:
+        delta["order"] = current_order
+    return delta
+
+
+def apply_delta(previous: List[Dict[str, Any]], delta: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """在上一次结果上应用增量，还原出本次完整结果（保持保存时的顺序）"""
+    rows = {result_key(r): dict(r) for r in previous}
+
+    for item in delta.get("exited", []):
+        rows.pop(item["key"], None)
+
+    legacy = delta.get("v") is None
+    for item in delta.get("changed", []):
+        row = rows.get(item["key"])
+        if row is None:
+            continue
+        for field, change in item["fields"].items():
+            if legacy:
+                # 旧格式: {"old", "new", "delta"}
+                if change["new"] is None and field not in row:
+                    continue
+                change = change["new"]
+            row[field] = change
+        for field in item.get("removed", []):
+            row.pop(field, None)
+
+    for row in delta.get("entered", []):
+        rows[result_key(row)] = dict(row)
+
+    if legacy:
+        # 旧格式未记录顺序，按当时的方式以市值排序
+        results = list(rows.values())
+        results.sort(key=lambda x: x.get("market_cap", 0) or 0, reverse=True)
+        return results
+    if "order" in delta:
+        return [rows[key] for key in delta["order"] if key in rows]
+    return list(rows.values())
+
+
+def expand_changes(previous: List[Dict[str, Any]], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """展示用：为字段变化补上旧值和差值 {"old", "new", "delta"}（旧值取自上一次结果）"""
+    if delta.get("v") is None:
+        return delta
+    prev_map = {result_key(r): r for r in previous}
+    changed = []
+    for item in delta.get("changed", []):
+        old_row = prev_map.get(item["key"], {})
+        fields = {}
+        for field, new_value in item["fields"].items():
+            old_value = old_row.get(field)
+            diff = None
+            if isinstance(old_value, (int, float)) and isinstance(new_value, (int, float)):
+                diff = new_value - old_value
+            fields[field] = {"old": old_value, "new": new_value, "delta": diff}
+        for field in item.get("removed", []):
+            fields[field] = {"old": old_row.get(field), "new": None, "delta": None}
+        changed.append({"key": item["key"], "symbol": item.get("symbol"), "fields": fields})
+    return {**delta, "changed": changed}
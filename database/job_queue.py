@@ -0,0 +1,202 @@
+"""
+基于 SQLite 的持久化任务队列与跨进程限流
+
+筛选进程把每个代币的补充任务写入 enrichment_jobs 表，多个 worker 进程以租约方式领取任务，
+完成后写回结果。worker 崩溃时租约到期，任务会被其他 worker 重新领取。
+"""
+
+import time
+import uuid
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy import select, update, delete, func, or_, and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, RATE_LIMITS
+from .models import EnrichmentJob, RateLimitBucket
+from .operations import DatabaseManager
+
+
+class JobQueue:
+    """补充数据任务队列"""
+
+    def __init__(self, db_manager: Optional[DatabaseManager] = None):
+        self.db = db_manager or DatabaseManager()
+
+    def enqueue(self, kind: str, payloads: List[Dict[str, Any]], priorities: Optional[List[int]] = None) -> str:
+        """批量写入任务，返回本批次的 run_id"""
+        run_id = uuid.uuid4().hex
+        priorities = priorities or [0] * len(payloads)
+        with self.db.get_session() as session:
+            session.add_all([
+                EnrichmentJob(run_id=run_id, kind=kind, payload=payload, priority=priority)
+                for payload, priority in zip(payloads, priorities)
+            ])
+        return run_id
+
+    def claim(self, worker_id: str, limit: int = 1, lease_seconds: float = JOB_LEASE_SECONDS) -> List[EnrichmentJob]:
+        """领取待处理任务（包括租约已过期的任务）"""
+        now = time.time()
+        lease_token = f"{worker_id}:{uuid.uuid4().hex[:8]}"
+
+        with self.db.get_session() as session:
+            # 超过最大尝试次数且租约过期的任务标记为失败
+            session.execute(
+                update(EnrichmentJob)
+                .where(
+                    EnrichmentJob.status == "running",
+                    EnrichmentJob.lease_expires_at < now,
+                    EnrichmentJob.attempts >= JOB_MAX_ATTEMPTS,
+                )
+                .values(status="failed", error="lease expired")
+            )
+
+            claimable = (
+                select(EnrichmentJob.id)
+                .where(or_(
+                    EnrichmentJob.status == "pending",
+                    and_(EnrichmentJob.status == "running", EnrichmentJob.lease_expires_at < now),
+                ))
+                .order_by(EnrichmentJob.priority.desc(), EnrichmentJob.id)
+                .limit(limit)
+            )
+            # 单条 UPDATE 语句在 SQLite 中是原子的，多个 worker 不会领到同一任务
+            session.execute(
+                update(EnrichmentJob)
+                .where(EnrichmentJob.id.in_(claimable.scalar_subquery()))
+                .values(
+                    status="running",
+                    lease_owner=lease_token,
+                    lease_expires_at=now + lease_seconds,
+                    attempts=EnrichmentJob.attempts + 1,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            jobs = (
+                session.query(EnrichmentJob)
+                .filter(EnrichmentJob.lease_owner == lease_token, EnrichmentJob.status == "running")
+                .all()
+            )
+            session.expunge_all()
+            return jobs
+
+    def complete(self, job_id: int, result: Any, lease_owner: str) -> bool:
+        """写回任务结果；租约已被其他 worker 重新领取时不写入并返回 False"""
+        with self.db.get_session() as session:
+            updated = session.execute(
+                update(EnrichmentJob)
+                .where(
+                    EnrichmentJob.id == job_id,
+                    EnrichmentJob.lease_owner == lease_owner,
+                    EnrichmentJob.status == "running",
+                )
+                .values(status="done", result=result, lease_expires_at=None)
+            )
+            return updated.rowcount == 1
+
+    def fail(self, job_id: int, error: str, lease_owner: str) -> bool:
+        """任务失败：未达到最大尝试次数时放回队列；租约已不属于调用者时不做修改并返回 False"""
+        with self.db.get_session() as session:
+            job = session.get(EnrichmentJob, job_id)
+            if not job or job.lease_owner != lease_owner or job.status != "running":
+                return False
+            job.error = error[:255]
+            job.lease_expires_at = None
+            job.status = "failed" if (job.attempts or 0) >= JOB_MAX_ATTEMPTS else "pending"
+            return True
+
+    def run_status(self, run_id: str) -> Dict[str, int]:
+        """统计某批次各状态的任务数"""
+        with self.db.get_session() as session:
+            rows = (
+                session.query(EnrichmentJob.status, func.count(EnrichmentJob.id))
+                .filter(EnrichmentJob.run_id == run_id)
+                .group_by(EnrichmentJob.status)
+                .all()
+            )
+            return {status: count for status, count in rows}
+
+    def wait(self, run_id: str, timeout: float, poll_interval: float = 0.5,
+             claim_timeout: Optional[float] = None) -> bool:
+        """等待某批次任务全部结束，超时返回 False
+
+        设置 claim_timeout 时，若超过该时长仍没有任何任务被领取过（没有 worker 在运行），提前返回 False
+        """
+        started = time.time()
+        deadline = started + timeout
+        while True:
+            status = self.run_status(run_id)
+            if not status.get("pending") and not status.get("running"):
+                return True
+            if time.time() >= deadline:
+                return False
+            if claim_timeout is not None and time.time() - started >= claim_timeout and not self.claimed(run_id):
+                return False
+            time.sleep(poll_interval)
+
+    def claimed(self, run_id: str) -> bool:
+        """某批次是否有任务被 worker 领取过"""
+        with self.db.get_session() as session:
+            return session.query(
+                session.query(EnrichmentJob.id)
+                .filter(EnrichmentJob.run_id == run_id, EnrichmentJob.attempts > 0)
+                .exists()
+            ).scalar()
+
+    def cancel(self, run_id: str) -> int:
+        """撤销某批次的全部任务（已被领取的任务之后提交结果时 complete/fail 返回 False），返回撤销的数量"""
+        with self.db.get_session() as session:
+            result = session.execute(delete(EnrichmentJob).where(EnrichmentJob.run_id == run_id))
+            return result.rowcount
+
+    def collect(self, run_id: str) -> List[Dict[str, Any]]:
+        """取出某批次所有任务的结果并从队列中删除"""
+        with self.db.get_session() as session:
+            jobs = (
+                session.query(EnrichmentJob)
+                .filter(EnrichmentJob.run_id == run_id)
+                .order_by(EnrichmentJob.id)
+                .all()
+            )
+            collected = [
+                {"payload": job.payload, "status": job.status, "result": job.result}
+                for job in jobs
+            ]
+            session.execute(delete(EnrichmentJob).where(EnrichmentJob.run_id == run_id))
+            return collected
+
+
+class SharedRateLimiter:
+    """跨进程共享的令牌桶限流器（状态存储在 SQLite）"""
+
+    def __init__(self, db_manager: Optional[DatabaseManager] = None, limits: Optional[Dict[str, float]] = None):
+        self.db = db_manager or DatabaseManager()
+        self.limits = limits or RATE_LIMITS
+
+    def try_acquire(self, name: str) -> bool:
+        """尝试获取一个令牌，成功返回 True"""
+        rate = self.limits.get(name)
+        if not rate:
+            return True
+
+        now = time.time()
+        capacity = max(rate, 1.0)
+        with self.db.get_session() as session:
+            session.execute(
+                sqlite_insert(RateLimitBucket)
+                .values(name=name, tokens=capacity, updated_at=now)
+                .on_conflict_do_nothing(index_elements=["name"])
+            )
+            refilled = func.min(capacity, RateLimitBucket.tokens + (now - RateLimitBucket.updated_at) * rate)
+            result = session.execute(
+                update(RateLimitBucket)
+                .where(RateLimitBucket.name == name, refilled >= 1)
+                .values(tokens=refilled - 1, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            return result.rowcount == 1
+
+    def acquire(self, name: str, poll_interval: float = 0.05):
+        """阻塞直到获取到令牌"""
+        while not self.try_acquire(name):
+            time.sleep(poll_interval)
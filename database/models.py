@@ -3,7 +3,7 @@
 """
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Index, Boolean
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -24,9 +24,20 @@ class Token(Base):
     holders = Column(Integer)
     price = Column(Float)
     price_change_24h = Column(Float)
+    top20_holders_pct = Column(Float)
+    binance_symbol = Column(String(50))
+    binance_volume_24h = Column(Float)
+    supply = Column(Float)
+    supply_updated_at = Column(DateTime)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_tokens_chain_market_cap", "chain", "market_cap"),
+        Index("ix_tokens_market_cap", "market_cap"),
+        Index("ix_tokens_binance_volume_24h", "binance_volume_24h"),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -39,18 +50,28 @@ class Token(Base):
             "holders": self.holders,
             "price": self.price,
             "price_change_24h": self.price_change_24h,
+            "top20_holders_pct": self.top20_holders_pct,
+            "binance_symbol": self.binance_symbol,
+            "binance_volume_24h": self.binance_volume_24h,
+            "supply": self.supply,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
 
 
 class History(Base):
-    """筛选历史记录模型"""
+    """筛选历史记录模型
+
+    每次筛选保存一条记录。仅快照记录（is_snapshot）保存完整结果，
+    其余记录只保存相对上一次的增量（delta），完整结果按需还原。
+    """
 
     __tablename__ = "histories"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     results = Column(JSON, default=list)
     result_count = Column(Integer, default=0)
+    is_snapshot = Column(Boolean, default=True)
+    delta = Column(JSON)
     screened_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     def to_dict(self):
@@ -58,5 +79,64 @@ class History(Base):
             "id": self.id,
             "results": self.results or [],
             "result_count": self.result_count,
+            "is_snapshot": self.is_snapshot is not False,
             "screened_at": self.screened_at.isoformat() if self.screened_at else None,
         }
+
+
+class EnrichmentJob(Base):
+    """代币数据补充任务（多进程 worker 共享的任务队列）"""
+
+    __tablename__ = "enrichment_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(String(64), nullable=False, index=True)
+    kind = Column(String(20), nullable=False)
+    priority = Column(Integer, default=0)
+    payload = Column(JSON, nullable=False)
+    status = Column(String(20), default="pending", nullable=False)
+    lease_owner = Column(String(64))
+    lease_expires_at = Column(Float)
+    attempts = Column(Integer, default=0)
+    result = Column(JSON)
+    error = Column(String(255))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_enrichment_jobs_status_priority", "status", "priority", "id"),
+    )
+
+
+class RateLimitBucket(Base):
+    """跨进程共享的令牌桶限流状态"""
+
+    __tablename__ = "rate_limit_buckets"
+
+    name = Column(String(50), primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+
+
+class HolderBalance(Base):
+    """BEP-20 代币持有者余额索引（由 Transfer 日志累加）"""
+
+    __tablename__ = "holder_balances"
+
+    token_address = Column(String(42), primary_key=True)
+    holder = Column(String(42), primary_key=True)
+    balance = Column(String(80), nullable=False, default="0")  # 精确整数余额（十进制字符串）
+    balance_value = Column(Float, nullable=False, default=0.0)  # 用于排序和占比计算
+
+    __table_args__ = (
+        Index("ix_holder_balances_token_value", "token_address", "balance_value"),
+    )
+
+
+class HolderIndexState(Base):
+    """每个代币的 Transfer 日志处理进度"""
+
+    __tablename__ = "holder_index_state"
+
+    token_address = Column(String(42), primary_key=True)
+    last_block = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -2,28 +2,55 @@
 数据库操作函数
 """
 
+import os
 from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict, Any
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text, func
 from sqlalchemy.orm import sessionmaker, Session
 
-from config import DATABASE_URL
+from config import DATABASE_URL, HISTORY_SNAPSHOT_INTERVAL, HISTORY_KEEP_SNAPSHOTS, WRITE_BEHIND, OFFLINE_MAX_AGE
 from .models import Base, Token, History
+from .delta import compute_delta, apply_delta, expand_changes
+from .writer import WriteBehindWriter
 
 
 class DatabaseManager:
     """数据库管理器"""
 
-    def __init__(self, db_url: str = DATABASE_URL):
+    def __init__(self, db_url: str = DATABASE_URL, write_behind: bool = WRITE_BEHIND):
         self.engine = create_engine(db_url, echo=False)
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine, "connect", _set_sqlite_pragmas)
         self.SessionLocal = sessionmaker(bind=self.engine)
+        self._latest_results = None  # (history_id, results) 最近一次结果的内存副本
+        self._save_listeners = []
+        # 结果版本文件：每次保存筛选结果后更新，其他进程无需查询数据库即可判断结果是否变化
+        db_path = self.engine.url.database if self.engine.dialect.name == "sqlite" else None
+        self.version_file = f"{db_path}.version" if db_path and db_path != ":memory:" else None
         self._ensure_tables()
+        # 异步写入：由单一后台线程批量提交代币和筛选结果
+        self.writer = WriteBehindWriter(self) if write_behind else None
 
     def _ensure_tables(self):
-        """确保数据库表已创建"""
+        """确保数据库表、新增列和索引已创建"""
         Base.metadata.create_all(self.engine)
+        self._add_missing_columns(Token)
+        self._add_missing_columns(History)
+        for index in Token.__table__.indexes:
+            index.create(self.engine, checkfirst=True)
+
+    def _add_missing_columns(self, model):
+        """为旧数据库补齐模型中新增的列（仅追加可空列）"""
+        table = model.__table__
+        existing = {col["name"] for col in inspect(self.engine).get_columns(table.name)}
+        with self.engine.begin() as conn:
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=self.engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
 
     @contextmanager
     def get_session(self) -> Session:
@@ -41,36 +68,339 @@ class DatabaseManager:
     def bulk_upsert_tokens(self, tokens_data: List[Dict[str, Any]]):
         """批量插入或更新代币数据"""
         with self.get_session() as session:
-            for token_data in tokens_data:
-                token = (
-                    session.query(Token)
-                    .filter(Token.address == token_data["address"])
-                    .first()
+            self._upsert_tokens(session, tokens_data)
+
+    def _upsert_tokens(self, session: Session, tokens_data: List[Dict[str, Any]]):
+        """在给定会话中插入或更新代币数据"""
+        addresses = [t["address"] for t in tokens_data]
+        existing = {}
+        for i in range(0, len(addresses), 500):
+            chunk = addresses[i:i + 500]
+            for token in session.query(Token).filter(Token.address.in_(chunk)):
+                existing[token.address] = token
+
+        for token_data in tokens_data:
+            token = existing.get(token_data["address"])
+            if token:
+                for key, value in token_data.items():
+                    if hasattr(token, key):
+                        setattr(token, key, value)
+                token.updated_at = datetime.utcnow()
+            else:
+                token = Token(**token_data)
+                session.add(token)
+                existing[token.address] = token
+
+    def submit_tokens(self, tokens_data: List[Dict[str, Any]]):
+        """保存代币数据：开启异步写入时交给后台写线程，否则同步写入"""
+        if self.writer is not None:
+            self.writer.submit_tokens(tokens_data)
+        else:
+            self.bulk_upsert_tokens(tokens_data)
+
+    def submit_cached_results(self, results: List[Dict[str, Any]]):
+        """保存筛选结果：开启异步写入时交给后台写线程，否则同步写入"""
+        if self.writer is not None:
+            self.writer.submit_results(results)
+        else:
+            self.save_cached_results(results)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待后台写线程写完已提交的数据"""
+        return self.writer.flush(timeout) if self.writer is not None else True
+
+    def query_tokens(
+        self,
+        criteria,
+        chain: Optional[str] = None,
+        limit: Optional[int] = None,
+        max_age: Optional[float] = OFFLINE_MAX_AGE,
+    ) -> List[Dict[str, Any]]:
+        """用 FilterCriteria 直接查询本地已存储的代币（离线筛选）
+
+        只返回 updated_at 在最近一次刷新前 max_age 秒内的代币（max_age 为 None 时不限制）
+        """
+        with self.get_session() as session:
+            query = session.query(Token)
+            if chain:
+                query = query.filter(Token.chain == chain)
+
+            if max_age is not None:
+                last_refresh = session.query(func.max(Token.updated_at)).scalar()
+                if last_refresh is None:
+                    return []
+                query = query.filter(Token.updated_at >= last_refresh - timedelta(seconds=max_age))
+
+            query = query.filter(Token.market_cap.isnot(None))
+            if criteria.min_market_cap:
+                query = query.filter(Token.market_cap >= criteria.min_market_cap)
+            if criteria.max_market_cap != float("inf"):
+                query = query.filter(Token.market_cap <= criteria.max_market_cap)
+
+            if criteria.min_top20_holders_pct is not None:
+                query = query.filter(Token.top20_holders_pct >= criteria.min_top20_holders_pct)
+
+            if criteria.check_binance and criteria.min_binance_volume:
+                query = query.filter(Token.binance_volume_24h >= criteria.min_binance_volume)
+
+            rank_column = Token.binance_volume_24h if criteria.rank_by == "binance_volume_24h" else Token.market_cap
+            query = query.order_by(rank_column.desc())
+            limit = limit or criteria.top_k
+            if limit:
+                query = query.limit(limit)
+
+            return [_token_to_result(token) for token in query]
+
+    def get_market_cap_estimates(self, binance_symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """按币安交易对获取缓存的市值和价格，用于估计排序优先级"""
+        estimates = {}
+        with self.get_session() as session:
+            for i in range(0, len(binance_symbols), 500):
+                chunk = binance_symbols[i:i + 500]
+                rows = (
+                    session.query(Token.binance_symbol, Token.market_cap, Token.price)
+                    .filter(Token.binance_symbol.in_(chunk))
+                    .order_by(Token.updated_at)
+                    .all()
+                )
+                # 同一交易对可能对应多个地址（DEXScreener 解析结果变化），按更新时间升序遍历，最新的覆盖旧的
+                for row in rows:
+                    estimates[row.binance_symbol] = {"market_cap": row.market_cap, "price": row.price}
+        return estimates
+
+    def get_supply_index(self, binance_symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """按币安交易对获取供应量索引（供应量及其更新时间、合约地址、链，以及上次获取的 DEX 成交量和涨跌幅）"""
+        index = {}
+        with self.get_session() as session:
+            for i in range(0, len(binance_symbols), 500):
+                chunk = binance_symbols[i:i + 500]
+                rows = (
+                    session.query(
+                        Token.binance_symbol,
+                        Token.supply,
+                        Token.supply_updated_at,
+                        Token.address,
+                        Token.chain,
+                        Token.name,
+                        Token.volume_24h,
+                        Token.price_change_24h,
+                    )
+                    .filter(Token.binance_symbol.in_(chunk), Token.supply.isnot(None))
+                    .order_by(Token.supply_updated_at)
+                    .all()
                 )
-                if token:
-                    for key, value in token_data.items():
-                        if hasattr(token, key):
-                            setattr(token, key, value)
-                    token.updated_at = datetime.utcnow()
-                else:
-                    token = Token(**token_data)
-                    session.add(token)
+                # 同上：取供应量最近更新的一行
+                for row in rows:
+                    index[row.binance_symbol] = {
+                        "supply": row.supply,
+                        "supply_updated_at": row.supply_updated_at,
+                        "address": row.address,
+                        "chain": row.chain,
+                        "name": row.name,
+                        "volume_24h": row.volume_24h,
+                        "price_change_24h": row.price_change_24h,
+                    }
+        return index
+
+    def get_last_refresh_time(self) -> Optional[datetime]:
+        """获取本地代币数据的最近更新时间"""
+        with self.get_session() as session:
+            return session.query(func.max(Token.updated_at)).scalar()
 
     def save_cached_results(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """保存缓存的筛选结果（保留最新一次）"""
+        """保存筛选结果：每隔若干次保存完整快照，其余只保存相对上次的增量"""
         with self.get_session() as session:
-            session.query(History).delete()
-            history = History(
-                results=results,
-                result_count=len(results),
-            )
-            session.add(history)
-            session.flush()
-            session.refresh(history)
-            return history.to_dict()
+            data = self._save_cached_results(session, results)
+        self._on_results_saved(data["id"], results)
+        return data
+
+    def add_save_listener(self, callback):
+        """注册筛选结果保存后的回调，参数为 history_id"""
+        self._save_listeners.append(callback)
+
+    def get_results_version(self) -> Optional[str]:
+        """读取结果版本（最近一次保存的 history_id），不访问数据库"""
+        if not self.version_file:
+            return None
+        try:
+            with open(self.version_file, encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _on_results_saved(self, history_id: int, results: List[Dict[str, Any]]):
+        """保存筛选结果后：更新内存副本、版本文件，并通知监听者"""
+        self._latest_results = (history_id, results)
+        if self.version_file:
+            tmp_path = f"{self.version_file}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(str(history_id))
+            os.replace(tmp_path, self.version_file)
+        for callback in self._save_listeners:
+            try:
+                callback(history_id)
+            except Exception:
+                pass
+
+    def _save_cached_results(self, session: Session, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """在给定会话中保存一次筛选结果"""
+        latest = session.query(History).order_by(History.id.desc()).first()
+        previous = self._reconstruct(session, latest.id) if latest else []
+        runs_since_snapshot = self._runs_since_snapshot(session)
+
+        is_snapshot = latest is None or runs_since_snapshot >= HISTORY_SNAPSHOT_INTERVAL
+        history = History(
+            results=results if is_snapshot else [],
+            result_count=len(results),
+            is_snapshot=is_snapshot,
+            delta=compute_delta(previous, results) if latest else None,
+        )
+        session.add(history)
+        session.flush()
+        session.refresh(history)
+
+        if is_snapshot:
+            self._prune_history(session)
+        data = history.to_dict()
+        data["results"] = results
+        return data
 
     def get_cached_results(self) -> Optional[Dict[str, Any]]:
-        """获取缓存的筛选结果"""
+        """获取缓存的筛选结果（最近一次）"""
+        with self.get_session() as session:
+            history = session.query(History).order_by(History.id.desc()).first()
+            if not history:
+                return None
+            data = history.to_dict()
+            data["results"] = self._reconstruct(session, history.id)
+            return data
+
+    def get_history_run(self, history_id: int) -> Optional[Dict[str, Any]]:
+        """获取指定一次筛选的完整结果"""
+        with self.get_session() as session:
+            history = session.get(History, history_id)
+            if not history:
+                return None
+            data = history.to_dict()
+            data["results"] = self._reconstruct(session, history.id)
+            return data
+
+    def list_history_runs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """列出最近的筛选记录（不含结果明细）"""
+        with self.get_session() as session:
+            rows = (
+                session.query(History.id, History.result_count, History.is_snapshot, History.screened_at)
+                .order_by(History.id.desc())
+                .limit(limit)
+                .all()
+            )
+            return [
+                {
+                    "id": row.id,
+                    "result_count": row.result_count,
+                    "is_snapshot": row.is_snapshot is not False,
+                    "screened_at": row.screened_at.isoformat() if row.screened_at else None,
+                }
+                for row in rows
+            ]
+
+    def get_latest_history_id(self) -> Optional[int]:
+        """最近一次已保存的筛选结果 id"""
+        with self.get_session() as session:
+            return session.query(func.max(History.id)).scalar()
+
+    def get_changes(self, history_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """获取某次筛选相对上一次的变化（默认最近一次）"""
         with self.get_session() as session:
-            history = session.query(History).first()
-            return history.to_dict() if history else None
+            if history_id is not None:
+                history = session.get(History, history_id)
+            else:
+                history = session.query(History).order_by(History.id.desc()).first()
+            if not history:
+                return None
+            delta = history.delta
+            if delta:
+                # 增量只保存新值，展示用的旧值和差值从上一次结果推出
+                previous_id = session.query(func.max(History.id)).filter(History.id < history.id).scalar()
+                previous = self._reconstruct(session, previous_id) if previous_id is not None else []
+                delta = expand_changes(previous, delta)
+            return {
+                "id": history.id,
+                "screened_at": history.screened_at.isoformat() if history.screened_at else None,
+                "delta": delta,
+            }
+
+    def _reconstruct(self, session: Session, history_id: int) -> List[Dict[str, Any]]:
+        """从最近的快照开始依次应用增量，还原指定记录的完整结果"""
+        if self._latest_results and self._latest_results[0] == history_id:
+            return self._latest_results[1]
+
+        snapshot = (
+            session.query(History)
+            .filter(History.id <= history_id, History.is_snapshot.isnot(False))
+            .order_by(History.id.desc())
+            .first()
+        )
+        if not snapshot:
+            return []
+
+        results = snapshot.results or []
+        deltas = (
+            session.query(History.delta)
+            .filter(History.id > snapshot.id, History.id <= history_id)
+            .order_by(History.id)
+        )
+        for (delta,) in deltas:
+            if delta:
+                results = apply_delta(results, delta)
+        return results
+
+    def _runs_since_snapshot(self, session: Session) -> int:
+        """最近一次快照（含）之后的记录数"""
+        snapshot_id = (
+            session.query(func.max(History.id))
+            .filter(History.is_snapshot.isnot(False))
+            .scalar()
+        )
+        if snapshot_id is None:
+            return 0
+        return session.query(func.count(History.id)).filter(History.id >= snapshot_id).scalar()
+
+    def _prune_history(self, session: Session):
+        """只保留最近 HISTORY_KEEP_SNAPSHOTS 个快照周期的记录"""
+        snapshot_ids = (
+            session.query(History.id)
+            .filter(History.is_snapshot.isnot(False))
+            .order_by(History.id.desc())
+            .limit(HISTORY_KEEP_SNAPSHOTS)
+            .all()
+        )
+        if len(snapshot_ids) < HISTORY_KEEP_SNAPSHOTS:
+            return
+        oldest_kept = snapshot_ids[-1].id
+        session.query(History).filter(History.id < oldest_kept).delete(synchronize_session=False)
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """SQLite 连接参数: WAL 模式允许读写并发"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def _token_to_result(token: Token) -> Dict[str, Any]:
+    """将数据库代币转换为与在线筛选结果相同的结构"""
+    return {
+        "symbol": token.symbol,
+        "name": token.name,
+        "address": token.address,
+        "chain": token.chain,
+        "market_cap": token.market_cap,
+        "price": token.price,
+        "volume": token.volume_24h,
+        "chg_24h": token.price_change_24h,
+        "top20_holders_pct": token.top20_holders_pct,
+        "binance_symbol": token.binance_symbol,
+        "binance_volume_24h": token.binance_volume_24h,
+    }
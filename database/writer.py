@@ -0,0 +1,191 @@
+"""
+异步写入（write-behind）
+
+筛选流程只把待写数据放入队列即返回；单一后台线程把一段时间内的代币更新和筛选结果
+合并到一个事务中提交，避免多个会话争抢 SQLite 写锁。进程退出时自动写完队列中的数据。
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy.exc import OperationalError
+
+from config import WRITE_BEHIND_BATCH_WINDOW, WRITE_BEHIND_MAX_BATCH
+
+logger = logging.getLogger(__name__)
+
+# 数据库被锁时的重试次数
+MAX_RETRIES = 3
+
+# 写入失败的数据重新排队的最多次数，超过后放入 failed 并记录错误
+MAX_ITEM_ATTEMPTS = 3
+
+_STOP = object()
+
+
+class WriteBehindWriter:
+    """单写线程的批量写入队列"""
+
+    def __init__(self, db_manager):
+        self.db = db_manager
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+        # 多次重试仍写入失败的数据（供排查），以及最近一次错误
+        self.failed: List[tuple] = []
+        self.last_error: Optional[str] = None
+
+    def submit_tokens(self, tokens_data: List[Dict[str, Any]]):
+        """提交代币 upsert"""
+        if tokens_data:
+            self._put(("tokens", tokens_data, 0))
+
+    def submit_results(self, results: List[Dict[str, Any]]):
+        """提交一次筛选结果"""
+        self._put(("results", results, 0))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待已提交的数据全部写入（包括失败重试），超时或等待期间有数据最终写入失败时返回 False"""
+        failed_before = len(self.failed)
+        if self._thread is None:
+            return True
+        deadline = None if timeout is None else time.time() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return len(self.failed) == failed_before
+
+    def close(self):
+        """写完剩余数据并停止写线程"""
+        with self._lock:
+            if self._closed or self._thread is None:
+                self._closed = True
+                return
+            self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _put(self, item):
+        with self._lock:
+            if self._closed:
+                # 已关闭时退化为同步写入
+                for failed_item in self._write_batch([item]):
+                    self._give_up(failed_item)
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+        self._queue.put(item)
+
+    def _run(self):
+        # 收到 _STOP 后继续处理，直到队列（包括失败重试重新排队的数据）为空才退出
+        stopping = False
+        while True:
+            if stopping:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+            else:
+                item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                stopping = True
+                continue
+
+            batch = [item]
+            deadline = time.time() + WRITE_BEHIND_BATCH_WINDOW
+            while len(batch) < WRITE_BEHIND_MAX_BATCH:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    next_item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if next_item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(next_item)
+
+            try:
+                for kind, payload, attempts in self._write_batch(batch):
+                    if attempts + 1 < MAX_ITEM_ATTEMPTS:
+                        # 在 task_done 之前重新排队，flush 会等待重试完成
+                        self._queue.put((kind, payload, attempts + 1))
+                    else:
+                        self._give_up((kind, payload, attempts + 1))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _give_up(self, item: tuple):
+        logger.error(f"异步写入多次失败，放弃写入 {item[0]}: {self.last_error}")
+        self.failed.append(item)
+
+    def _write_batch(self, batch: list) -> list:
+        """写入一批数据，返回写入失败的条目
+
+        整批失败时逐条重写，一条坏数据不会连累同批的其他数据
+        """
+        try:
+            self._write_items(batch)
+            return []
+        except Exception as e:
+            self.last_error = str(e)
+            if len(batch) == 1:
+                logger.warning(f"异步写入失败，稍后重试: {e}")
+                return list(batch)
+
+        failed = []
+        for item in batch:
+            try:
+                self._write_items([item])
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"异步写入失败，稍后重试: {e}")
+                failed.append(item)
+        return failed
+
+    def _write_items(self, batch: list):
+        """在一个事务中写入：代币按地址合并，筛选结果按提交顺序保存；数据库被锁时短暂等待重试"""
+        tokens_by_address: Dict[str, Dict[str, Any]] = {}
+        results_list = []
+        for kind, payload, _ in batch:
+            if kind == "tokens":
+                for token_data in payload:
+                    merged = tokens_by_address.setdefault(token_data["address"], {})
+                    merged.update(token_data)
+            else:
+                results_list.append(payload)
+
+        saved = None
+        for attempt in range(1, MAX_RETRIES + 1):
+            try:
+                with self.db.get_session() as session:
+                    if tokens_by_address:
+                        self.db._upsert_tokens(session, list(tokens_by_address.values()))
+                    for results in results_list:
+                        saved = self.db._save_cached_results(session, results)
+                break
+            except OperationalError as e:
+                if "database is locked" not in str(e) or attempt == MAX_RETRIES:
+                    raise
+                time.sleep(0.1 * attempt)
+
+        # 已提交，通知失败不能导致重写
+        if saved is not None:
+            try:
+                self.db._on_results_saved(saved["id"], results_list[-1])
+            except Exception as e:
+                logger.warning(f"结果版本通知失败: {e}")
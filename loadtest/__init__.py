@@ -0,0 +1 @@
+"""并发会话压测工具"""
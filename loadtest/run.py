@@ -0,0 +1,226 @@
+"""
+Streamlit 应用并发会话压测
+
+模拟 N 个分析师会话同时点击「开始筛选」：每个会话在独立线程中执行与 app.py 相同的筛选路径
+（TokenScreener.fetch_and_filter + DatabaseManager.submit_cached_results），
+上游 API 指向本地桩服务。输出吞吐、筛选延迟分位数、数据库锁错误数和每会话内存。
+可同时运行 backfill 通道的后台会话，观察界面会话的延迟是否受影响。
+
+运行: python -m loadtest.run --sessions 20 --iterations 3
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import tempfile
+import threading
+import time
+from typing import List, Dict, Any
+
+from sqlalchemy.exc import OperationalError
+
+from database import DatabaseManager
+from services import binance, bsc_holders
+from services.binance import binance_api
+from services.dexscreener import dex_api
+from services.tokenpocket import tp_api
+from services.screener import TokenScreener, create_filter_criteria
+from loadtest.stub_server import StubUniverse, start_stub_server
+
+
+class LockErrorCounter(logging.Handler):
+    """统计被业务代码记录到日志里的 “database is locked” 错误"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        if "database is locked" in record.getMessage():
+            with self._lock:
+                self.count += 1
+
+
+def point_apis_at(base_url: str):
+    """将上游 API 客户端指向桩服务"""
+    binance.BINANCE_FUTURES_URLS[:] = [base_url]
+    binance_api._cache = None
+    binance_api._contracts = None
+    dex_api.base_url = base_url
+    tp_api.base_url = base_url
+    # HOLDER_BACKEND = "bsc_logs" 时持有者索引的 eth_getLogs 也发往桩服务
+    bsc_holders.BSC_RPC_URL = base_url
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩法分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_session(db: DatabaseManager, iterations: int, think_time: float, criteria_kwargs: Dict[str, Any],
+                latencies: List[float], counters: Dict[str, int], lock: threading.Lock, lane: str = "interactive"):
+    """单个模拟会话：重复执行筛选 + 保存结果"""
+    for _ in range(iterations):
+        started = time.perf_counter()
+        error = None
+        try:
+            criteria = create_filter_criteria(**criteria_kwargs)
+            results = TokenScreener(db, lane=lane).fetch_and_filter(criteria, fetch_top20_holders=True)
+            db.submit_cached_results(results)
+        except OperationalError as e:
+            error = "locked" if "database is locked" in str(e) else "error"
+        except Exception:
+            error = "error"
+        elapsed = time.perf_counter() - started
+
+        with lock:
+            latencies.append(elapsed)
+            counters["screens"] += 1
+            if error == "locked":
+                counters["lock_errors"] += 1
+            elif error:
+                counters["errors"] += 1
+
+        if think_time:
+            time.sleep(think_time)
+
+
+def run_load_test(sessions: int, iterations: int = 1, universe_size: int = 300, latency: float = 0.01,
+                  think_time: float = 0.0, db_url: str = None, backfill_sessions: int = 0) -> Dict[str, Any]:
+    """执行一次压测并返回统计结果"""
+    universe = StubUniverse(universe_size)
+    server = start_stub_server(universe, latency=latency)
+    host, port = server.server_address
+    point_apis_at(f"http://{host}:{port}")
+
+    if db_url is None:
+        db_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='loadtest-'), 'loadtest.db')}"
+    # 与 app.py 一致：所有会话共享一个 DatabaseManager
+    db = DatabaseManager(db_url)
+
+    lock_counter = LockErrorCounter()
+    for name in ("services.screener", "database.writer"):
+        logging.getLogger(name).addHandler(lock_counter)
+
+    criteria_kwargs = {
+        "min_market_cap": 1_000_000,
+        "max_market_cap": 300_000_000,
+        "min_top20_holders_pct": 80,
+        "min_binance_volume": 1_000_000,
+        "check_binance": True,
+    }
+    latencies: List[float] = []
+    counters = {"screens": 0, "errors": 0, "lock_errors": 0}
+    lock = threading.Lock()
+    # 后台会话的统计单独记录，延迟分位数只统计界面会话
+    backfill_latencies: List[float] = []
+    backfill_counters = {"screens": 0, "errors": 0, "lock_errors": 0}
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(
+            target=run_session,
+            args=(db, iterations, think_time, criteria_kwargs, latencies, counters, lock),
+            daemon=True,
+        )
+        for _ in range(sessions)
+    ]
+    # 后台会话一直运行到界面会话结束
+    stop_backfill = threading.Event()
+    backfill_threads = [
+        threading.Thread(
+            target=_run_backfill_session,
+            args=(db, stop_backfill, criteria_kwargs, backfill_latencies, backfill_counters, lock),
+            daemon=True,
+        )
+        for _ in range(backfill_sessions)
+    ]
+    for t in backfill_threads:
+        t.start()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall_time = time.perf_counter() - started
+    stop_backfill.set()
+    for t in backfill_threads:
+        t.join()
+    # 异步写入时等待后台写线程写完，单独计时
+    flush_started = time.perf_counter()
+    db.flush()
+    flush_time = time.perf_counter() - flush_started
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    for name in ("services.screener", "database.writer"):
+        logging.getLogger(name).removeHandler(lock_counter)
+    server.shutdown()
+
+    return {
+        "sessions": sessions,
+        "iterations": iterations,
+        "universe_size": universe_size,
+        "screens": counters["screens"],
+        "errors": counters["errors"],
+        "db_lock_errors": counters["lock_errors"] + backfill_counters["lock_errors"] + lock_counter.count,
+        "wall_time_s": round(wall_time, 3),
+        "flush_time_s": round(flush_time, 3),
+        "throughput_per_s": round(counters["screens"] / wall_time, 3) if wall_time else 0.0,
+        "latency_p50_s": round(percentile(latencies, 50), 3),
+        "latency_p95_s": round(percentile(latencies, 95), 3),
+        "latency_p99_s": round(percentile(latencies, 99), 3),
+        # ru_maxrss 在 Linux 上单位为 KB
+        "memory_per_session_kb": round(max(0, rss_after - rss_before) / (sessions + backfill_sessions), 1),
+        "backfill_sessions": backfill_sessions,
+        "backfill_screens": backfill_counters["screens"],
+        "backfill_latency_p50_s": round(percentile(backfill_latencies, 50), 3),
+    }
+
+
+def _run_backfill_session(db: DatabaseManager, stop_event: threading.Event, criteria_kwargs: Dict[str, Any],
+                          latencies: List[float], counters: Dict[str, int], lock: threading.Lock):
+    """backfill 通道的后台会话：不断重复筛选直到界面会话结束"""
+    while not stop_event.is_set():
+        run_session(db, 1, 0.0, criteria_kwargs, latencies, counters, lock, lane="backfill")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamlit 应用并发会话压测")
+    parser.add_argument("--sessions", "-n", type=int, default=10, help="并发会话数")
+    parser.add_argument("--iterations", "-i", type=int, default=1, help="每个会话的筛选次数")
+    parser.add_argument("--universe", type=int, default=300, help="桩服务代币数量")
+    parser.add_argument("--latency", type=float, default=0.01, help="桩服务每个请求的延迟（秒）")
+    parser.add_argument("--think-time", type=float, default=0.0, help="会话两次筛选之间的间隔（秒）")
+    parser.add_argument("--backfill-sessions", type=int, default=0, help="同时运行的 backfill 通道后台会话数")
+    parser.add_argument("--db-url", default=None, help="数据库地址（默认使用临时 SQLite 文件）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+    logging.getLogger("urllib3").setLevel(logging.ERROR)
+    report = run_load_test(
+        sessions=args.sessions,
+        iterations=args.iterations,
+        universe_size=args.universe,
+        latency=args.latency,
+        think_time=args.think_time,
+        db_url=args.db_url,
+        backfill_sessions=args.backfill_sessions,
+    )
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    for key, value in report.items():
+        print(f"{key:24s} {value}")
+
+
+if __name__ == "__main__":
+    main()
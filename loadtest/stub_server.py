@@ -0,0 +1,199 @@
+"""
+本地上游 API 桩服务
+
+模拟币安期货、DEXScreener、TokenPocket 的接口，以及 BSC JSON-RPC 节点的
+eth_blockNumber / eth_getLogs（Transfer 日志），供压测和本地验证使用，不访问真实网络。
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+
+class StubUniverse:
+    """桩服务使用的代币集合"""
+
+    def __init__(self, size: int = 300, seed: int = 42, block_number: int = 1000, max_logs: int = 1000):
+        rng = random.Random(seed)
+        self.seed = seed
+        self.block_number = block_number
+        self.max_logs = max_logs  # 与公共节点一样，单次 eth_getLogs 返回过多时报错
+        self._transfers = {}  # address -> [(block, from, to, value)]
+        self.tokens = {}
+        for i in range(size):
+            symbol = f"TK{i:04d}"
+            price = rng.uniform(0.001, 50)
+            self.tokens[symbol] = {
+                "symbol": symbol,
+                "address": f"0x{i:040x}",
+                "price": price,
+                "supply": rng.uniform(1e6, 1e10),
+                "volume": rng.uniform(1e5, 5e8),
+                "top20_pct": rng.uniform(50, 100),
+                # 少量 1000 倍乘数合约和结算中合约，与真实币安期货类似
+                "multiplier": 1000 if i % 25 == 7 else 1,
+                "status": "SETTLING" if i % 20 == 13 else "TRADING",
+            }
+
+    @staticmethod
+    def _base_asset(token: dict) -> str:
+        return f"1000{token['symbol']}" if token["multiplier"] == 1000 else token["symbol"]
+
+    def tickers(self) -> list:
+        return [
+            {
+                "symbol": f"{self._base_asset(t)}USDT",
+                "quoteVolume": str(t["volume"]),
+                "lastPrice": str(t["price"] * t["multiplier"]),
+                "priceChangePercent": "1.5",
+            }
+            for t in self.tokens.values()
+        ]
+
+    def exchange_info(self) -> dict:
+        return {"symbols": [
+            {
+                "symbol": f"{self._base_asset(t)}USDT",
+                "status": t["status"],
+                "contractType": "PERPETUAL",
+                "underlyingType": "COIN",
+                "baseAsset": self._base_asset(t),
+                "quoteAsset": "USDT",
+            }
+            for t in self.tokens.values()
+        ]}
+
+    def search(self, query: str) -> dict:
+        token = self.tokens.get(query.upper())
+        if not token:
+            return {"pairs": []}
+        return {"pairs": [{
+            "chainId": "bsc",
+            "baseToken": {"address": token["address"], "symbol": token["symbol"], "name": token["symbol"]},
+            "priceUsd": str(token["price"]),
+            "fdv": token["price"] * token["supply"],
+            "volume": {"h24": token["volume"] / 10},
+            "priceChange": {"h24": 1.5},
+        }]}
+
+    def holder_info(self, symbol: str) -> dict:
+        token = self.tokens.get((symbol or "").upper())
+        if not token:
+            return {"data": {}}
+        return {"data": {
+            "top_1_20": token["supply"] * token["top20_pct"] / 100,
+            "total_supply": token["supply"],
+        }}
+
+
+    def transfers(self, address: str) -> list:
+        """按地址确定性生成的 Transfer 记录：在创建区块铸造，之后在 40 个持有者之间随机转账"""
+        address = address.lower()
+        if address not in self._transfers:
+            rng = random.Random(f"{self.seed}:{address}")
+            holders = [f"0x{rng.getrandbits(160):040x}" for _ in range(40)]
+            supply = 10 ** 24
+            creation = self.creation_block(address)
+            records = [(creation, "0x" + "0" * 40, holders[0], supply)]
+            balances = {holders[0]: supply}
+            for block in range(creation + 1, 100_000, 7):
+                sender = rng.choice([h for h in holders if balances.get(h)])
+                value = rng.randint(1, balances[sender])
+                receiver = rng.choice(holders)
+                balances[sender] -= value
+                balances[receiver] = balances.get(receiver, 0) + value
+                records.append((block, sender, receiver, value))
+            self._transfers[address] = records
+        return self._transfers[address]
+
+    def creation_block(self, address: str) -> int:
+        return random.Random(f"{self.seed}:{address.lower()}:creation").randint(1, 5000)
+
+    def get_logs(self, address: str, from_block: int, to_block: int) -> list:
+        to_block = min(to_block, self.block_number)
+        return [
+            {
+                "address": address,
+                "blockNumber": hex(block),
+                "topics": [TRANSFER_TOPIC, "0x" + sender[2:].rjust(64, "0"), "0x" + receiver[2:].rjust(64, "0")],
+                "data": hex(value),
+            }
+            for block, sender, receiver, value in self.transfers(address)
+            if from_block <= block <= to_block
+        ]
+
+    def rpc(self, request: dict) -> dict:
+        """处理一条 JSON-RPC 请求"""
+        method, params = request.get("method"), request.get("params") or []
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        if method == "eth_blockNumber":
+            response["result"] = hex(self.block_number)
+        elif method == "eth_getCode":
+            address, block = params[0], int(params[1], 16)
+            response["result"] = "0x6080" if block >= self.creation_block(address) else "0x"
+        elif method == "eth_getLogs":
+            query = params[0]
+            logs = self.get_logs(query["address"], int(query["fromBlock"], 16), int(query["toBlock"], 16))
+            if len(logs) > self.max_logs:
+                response["error"] = {"code": -32005, "message": f"query returned more than {self.max_logs} results"}
+            else:
+                response["result"] = logs
+        else:
+            response["error"] = {"code": -32601, "message": f"method not found: {method}"}
+        return response
+
+
+def make_handler(universe: StubUniverse, latency: float):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+            if latency:
+                time.sleep(latency)
+
+            if parsed.path == "/fapi/v1/ticker/24hr":
+                body = universe.tickers()
+            elif parsed.path == "/fapi/v1/exchangeInfo":
+                body = universe.exchange_info()
+            elif parsed.path == "/latest/dex/search":
+                body = universe.search(params.get("q", ""))
+            elif parsed.path == "/v1/token/holder_info":
+                body = universe.holder_info(params.get("bl_symbol"))
+            else:
+                self.send_error(404)
+                return
+
+            self._send(body)
+
+        def do_POST(self):
+            # BSC JSON-RPC
+            if latency:
+                time.sleep(latency)
+            length = int(self.headers.get("Content-Length", 0))
+            self._send(universe.rpc(json.loads(self.rfile.read(length) or b"{}")))
+
+        def _send(self, body):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(universe: StubUniverse, latency: float = 0.0, port: int = 0) -> ThreadingHTTPServer:
+    """在后台线程启动桩服务，返回 server（server.server_address 为实际地址）"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(universe, latency))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
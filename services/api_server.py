@@ -0,0 +1,246 @@
+"""
+只读筛选结果 HTTP 服务（独立于 Streamlit）
+
+接口:
+    GET /results/latest          最近一次筛选结果
+    GET /results/<id>            指定一次筛选结果
+    GET /results                 历史筛选记录列表（不含明细）
+
+查询参数:
+    fields=symbol,market_cap     只返回指定字段
+    page=1&page_size=100         分页
+
+支持 ETag / If-None-Match（304）和 gzip。最近一次结果保存在内存中，
+仅当结果版本文件变化（有新结果保存）时才重新读取数据库。
+
+启动命令: python -m services.api_server --port 8600
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+from config import API_HOST, API_PORT
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# 已渲染响应的缓存条数
+RENDER_CACHE_SIZE = 256
+
+
+class ResultsCache:
+    """筛选结果的内存副本，按结果版本失效"""
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+        self._lock = threading.Lock()
+        self._latest: Optional[Dict[str, Any]] = None
+        self._version: Optional[str] = None
+        self._runs: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._rendered: "OrderedDict[tuple, Tuple[str, bytes, bytes]]" = OrderedDict()
+        db.add_save_listener(lambda history_id: self.invalidate())
+
+    def invalidate(self):
+        with self._lock:
+            self._latest = None
+            self._rendered.clear()
+
+    def version(self) -> str:
+        """当前结果版本：有版本文件时读取文件，否则为内存中最近一次结果的 id"""
+        version = self.db.get_results_version()
+        if version is not None:
+            return version
+        latest = self.latest()
+        return str(latest["id"]) if latest else "empty"
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        version = self.db.get_results_version()
+        with self._lock:
+            if self._latest is not None and (version is None or version == self._version):
+                return self._latest
+        latest = self.db.get_cached_results()
+        with self._lock:
+            self._latest, self._version = latest, version
+            self._rendered.clear()
+        return latest
+
+    def run(self, history_id: int) -> Optional[Dict[str, Any]]:
+        """历史结果不会再变化，按 id 缓存"""
+        with self._lock:
+            if history_id in self._runs:
+                self._runs.move_to_end(history_id)
+                return self._runs[history_id]
+        data = self.db.get_history_run(history_id)
+        if data is not None:
+            with self._lock:
+                self._runs[history_id] = data
+                while len(self._runs) > 32:
+                    self._runs.popitem(last=False)
+        return data
+
+    def rendered(self, key: tuple, build) -> Tuple[str, bytes, bytes]:
+        """返回 (etag, body, gzip_body)，相同请求只序列化一次"""
+        with self._lock:
+            if key in self._rendered:
+                self._rendered.move_to_end(key)
+                return self._rendered[key]
+        payload = build()
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        entry = (etag, body, gzip.compress(body, compresslevel=5))
+        with self._lock:
+            self._rendered[key] = entry
+            while len(self._rendered) > RENDER_CACHE_SIZE:
+                self._rendered.popitem(last=False)
+        return entry
+
+
+def project_results(data: Dict[str, Any], fields: Optional[list], page: int, page_size: int) -> Dict[str, Any]:
+    """字段投影 + 分页"""
+    results = data.get("results") or []
+    total = len(results)
+    start = (page - 1) * page_size
+    rows = results[start:start + page_size]
+    if fields:
+        rows = [{f: row.get(f) for f in fields} for row in rows]
+    return {
+        "id": data.get("id"),
+        "screened_at": data.get("screened_at"),
+        "result_count": total,
+        "page": page,
+        "page_size": page_size,
+        "total_pages": max(1, -(-total // page_size)),
+        "results": rows,
+    }
+
+
+def _parse_paging(params: Dict[str, str]) -> Tuple[int, int]:
+    try:
+        page = max(1, int(params.get("page", 1)))
+        page_size = min(MAX_PAGE_SIZE, max(1, int(params.get("page_size", DEFAULT_PAGE_SIZE))))
+    except ValueError:
+        raise ValueError("page / page_size 必须为整数")
+    return page, page_size
+
+
+def make_handler(cache: ResultsCache):
+    class ResultsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+            try:
+                page, page_size = _parse_paging(params)
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            fields = [f for f in params.get("fields", "").split(",") if f] or None
+            query_key = (tuple(fields or ()), page, page_size)
+
+            path = parsed.path.rstrip("/")
+            if path == "/results/latest":
+                version = cache.version()
+                data = cache.latest()
+                if data is None:
+                    self._send_json(404, {"error": "暂无筛选结果"})
+                    return
+                key = ("latest", version) + query_key
+                entry = cache.rendered(key, lambda: project_results(data, fields, page, page_size))
+            elif path == "/results":
+                version = cache.version()
+                key = ("runs", version, page, page_size)
+                entry = cache.rendered(key, lambda: self._list_runs(cache, page, page_size))
+            elif re.fullmatch(r"/results/\d+", path):
+                history_id = int(path.rsplit("/", 1)[1])
+                data = cache.run(history_id)
+                if data is None:
+                    self._send_json(404, {"error": "记录不存在"})
+                    return
+                key = ("run", history_id) + query_key
+                entry = cache.rendered(key, lambda: project_results(data, fields, page, page_size))
+            else:
+                self._send_json(404, {"error": "未知接口"})
+                return
+
+            self._send_cached(*entry)
+
+        @staticmethod
+        def _list_runs(cache: ResultsCache, page: int, page_size: int) -> Dict[str, Any]:
+            runs = cache.db.list_history_runs(limit=page * page_size)
+            start = (page - 1) * page_size
+            return {"page": page, "page_size": page_size, "runs": runs[start:start + page_size]}
+
+        def _send_cached(self, etag: str, body: bytes, gzip_body: bytes):
+            use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+            payload = gzip_body if use_gzip else body
+            # 强 ETag 对应具体字节，gzip 与原始响应体使用不同的 ETag
+            if use_gzip:
+                etag = etag[:-1] + '-gzip"'
+            if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Vary", "Accept-Encoding")
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Vary", "Accept-Encoding")
+            if use_gzip:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _send_json(self, status: int, payload: Dict[str, Any]):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return ResultsHandler
+
+
+def create_server(host: str = API_HOST, port: int = API_PORT, db: Optional[DatabaseManager] = None) -> ThreadingHTTPServer:
+    """创建结果服务（调用 serve_forever() 启动）"""
+    cache = ResultsCache(db or DatabaseManager(write_behind=False))
+    server = ThreadingHTTPServer((host, port), make_handler(cache))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="只读筛选结果 HTTP 服务")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    server = create_server(args.host, args.port)
+    logger.info(f"结果服务已启动: http://{args.host}:{args.port}/results/latest")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,11 +5,13 @@
 """
 
 import logging
-from typing import Dict, Any, Optional
+import re
+import time
+from typing import Dict, Any, List, Optional
 
 import requests
 
-from config import REQUEST_TIMEOUT, PROXIES
+from config import REQUEST_TIMEOUT, PROXIES, CONTRACT_METADATA_TTL
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +20,19 @@ BINANCE_FUTURES_URLS = [
     "https://fapi.binance.com",
 ]
 
+# 合约基础资产的数量前缀，如 1000PEPE 表示 1 张合约对应 1000 个 PEPE
+MULTIPLIER_PREFIX = re.compile(r"^(1000000|100000|10000|1000|1M)(?=[A-Z])")
+PREFIX_MULTIPLIERS = {"1M": 1_000_000}
+
+
+def parse_base_asset(base_asset: str) -> tuple:
+    """拆分合约基础资产的数量前缀，返回 (代币符号, 乘数)"""
+    match = MULTIPLIER_PREFIX.match(base_asset)
+    if not match:
+        return base_asset, 1
+    prefix = match.group(1)
+    return base_asset[len(prefix):], PREFIX_MULTIPLIERS.get(prefix) or int(prefix)
+
 
 class BinanceFuturesAPI:
     """币安期货 API 客户端"""
@@ -30,6 +45,8 @@ class BinanceFuturesAPI:
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
         })
         self._cache = None
+        self._contracts: Optional[Dict[str, Dict[str, Any]]] = None
+        self._contracts_at = 0.0
 
     def _request(self, url: str, params: Optional[Dict] = None) -> Dict:
         """发送 API 请求"""
@@ -41,9 +58,9 @@ class BinanceFuturesAPI:
             logger.warning(f"币安 API 请求失败: {url}, 错误: {e}")
             return {}
 
-    def get_all_tickers(self) -> Dict[str, Dict[str, Any]]:
-        """获取期货所有交易对数据"""
-        if self._cache is not None:
+    def get_all_tickers(self, refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+        """获取期货所有交易对数据（refresh=True 时忽略缓存重新拉取）"""
+        if self._cache is not None and not refresh:
             return self._cache
 
         for base_url in BINANCE_FUTURES_URLS:
@@ -63,6 +80,92 @@ class BinanceFuturesAPI:
         logger.error("币安期货 API 所有域名均不可用")
         return {}
 
+    def get_contract_metadata(self, refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+        """获取合约元数据（exchangeInfo），按 CONTRACT_METADATA_TTL 缓存
+
+        返回 {合约代码: {"status", "contract_type", "underlying_type", "base_asset", "token_symbol", "multiplier"}}，
+        请求失败时沿用上一次的数据（没有时返回空字典）
+        """
+        if self._contracts is not None and not refresh and time.time() - self._contracts_at < CONTRACT_METADATA_TTL:
+            return self._contracts
+
+        for base_url in BINANCE_FUTURES_URLS:
+            data = self._request(f"{base_url}/fapi/v1/exchangeInfo")
+            if isinstance(data, dict) and isinstance(data.get("symbols"), list):
+                contracts = {}
+                for item in data["symbols"]:
+                    base_asset = item.get("baseAsset") or ""
+                    token_symbol, multiplier = parse_base_asset(base_asset)
+                    contracts[item.get("symbol")] = {
+                        "status": item.get("status"),
+                        "contract_type": item.get("contractType"),
+                        "underlying_type": item.get("underlyingType"),
+                        "quote_asset": item.get("quoteAsset"),
+                        "base_asset": base_asset,
+                        "token_symbol": token_symbol,
+                        "multiplier": multiplier,
+                    }
+                self._contracts = contracts
+                self._contracts_at = time.time()
+                logger.info(f"币安合约元数据已刷新: {len(contracts)} 个合约")
+                return contracts
+
+        logger.warning("币安合约元数据获取失败，沿用缓存数据")
+        # 失败后不在每次筛选时重试，稍后再试
+        self._contracts_at = time.time() - CONTRACT_METADATA_TTL + 300
+        if self._contracts is None:
+            self._contracts = {}
+        return self._contracts
+
+    def get_universe(self, refresh: bool = False) -> List[Dict[str, Any]]:
+        """可筛选的 USDT 永续合约：剔除非交易状态、交割合约和指数合约，并按乘数换算为单个代币的价格
+
+        返回 [{"symbol", "binance_symbol", "multiplier", "ticker"}]
+        """
+        tickers = self.get_all_tickers(refresh=refresh)
+        contracts = self.get_contract_metadata()
+
+        universe, pruned = [], {}
+        for symbol, ticker in tickers.items():
+            contract = contracts.get(symbol)
+            if contract is None:
+                # 元数据中没有（刚上线或元数据不可用）：只接受形如 XXXUSDT 的永续合约代码，按代码解析
+                if not symbol.endswith("USDT") or "_" in symbol:
+                    pruned["unknown"] = pruned.get("unknown", 0) + 1
+                    continue
+                token_symbol, multiplier = parse_base_asset(symbol[:-len("USDT")])
+            else:
+                reason = self._prune_reason(contract)
+                if reason:
+                    pruned[reason] = pruned.get(reason, 0) + 1
+                    continue
+                token_symbol, multiplier = contract["token_symbol"], contract["multiplier"]
+            if not token_symbol:
+                continue
+            universe.append({
+                "symbol": token_symbol,
+                "binance_symbol": symbol,
+                "multiplier": multiplier,
+                "ticker": ticker,
+            })
+
+        if pruned:
+            logger.info(f"剔除 {sum(pruned.values())} 个不可筛选的合约: {pruned}")
+        return universe
+
+    @staticmethod
+    def _prune_reason(contract: Dict[str, Any]) -> Optional[str]:
+        """合约不参与筛选的原因（可筛选时返回 None）"""
+        if contract.get("status") != "TRADING":
+            return (contract.get("status") or "unknown").lower()
+        if contract.get("contract_type") not in (None, "PERPETUAL"):
+            return "delivery"
+        if contract.get("quote_asset") not in (None, "USDT"):
+            return "quote"
+        if contract.get("underlying_type") not in (None, "COIN"):
+            return "index"
+        return None
+
     def get_ticker_by_symbol(self, token_symbol: str) -> Optional[Dict[str, Any]]:
         """根据代币符号获取币安数据"""
         all_tickers = self.get_all_tickers()
@@ -0,0 +1,344 @@
+"""
+BSC 持仓集中度（本地计算）
+
+从 BSC JSON-RPC 节点读取 BEP-20 Transfer 日志，在 SQLite 中维护每个代币的持有者余额索引，
+并记录已处理到的区块。首次回填从合约创建区块开始，在筛选流程之外进行（命令行，或调度器的 backfill 通道）；
+筛选时只做少量增量同步。前 10/20/50 持有者占比为本地查询。
+
+回填命令: python -m services.bsc_holders 0x代币地址 [0x代币地址 ...]
+"""
+
+import argparse
+import itertools
+import logging
+import re
+import threading
+from typing import List, Dict, Any, Optional, Iterable
+
+import requests
+from sqlalchemy import func, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from config import (
+    REQUEST_TIMEOUT,
+    PROXIES,
+    BSC_RPC_URL,
+    BSC_LOG_START_BLOCK,
+    BSC_LOG_BLOCK_RANGE,
+    BSC_LOG_CONFIRMATIONS,
+    BSC_LOG_INLINE_MAX_BLOCKS,
+)
+from database import DatabaseManager, HolderBalance, HolderIndexState
+from services.scheduler import enrichment_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Transfer(address,address,uint256) 事件签名
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+ZERO_ADDRESS = "0x" + "0" * 40
+
+# 节点因查询区块跨度或返回条数过大而拒绝 eth_getLogs 时的错误信息
+RANGE_LIMIT_ERROR = re.compile(
+    r"block range|more than \d+ results|too many (results|logs|blocks)|query returned more than|response size",
+    re.IGNORECASE,
+)
+
+
+# 进程内共享：每个 TokenScreener 都有自己的 BscHolderIndex，回填去重和同步互斥必须跨实例生效
+# 键为 (数据库地址, 代币地址)
+_backfilling = set()
+_sync_locks: Dict[tuple, threading.Lock] = {}
+_state_lock = threading.Lock()
+
+
+class RpcError(Exception):
+    """JSON-RPC 返回错误"""
+
+    @property
+    def is_range_limit(self) -> bool:
+        return bool(RANGE_LIMIT_ERROR.search(str(self)))
+
+
+class BscRpcClient:
+    """最小化的 JSON-RPC 客户端"""
+
+    def __init__(self, rpc_url: Optional[str] = None, proxies: dict = None):
+        # 默认地址在创建时读取，压测可将模块的 BSC_RPC_URL 指向桩服务
+        self.rpc_url = rpc_url or BSC_RPC_URL
+        self.proxies = proxies or PROXIES
+        self.session = requests.Session()
+        self._ids = itertools.count(1)
+
+    def _call(self, method: str, params: list) -> Any:
+        payload = {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params}
+        response = self.session.post(self.rpc_url, json=payload, timeout=REQUEST_TIMEOUT, proxies=self.proxies)
+        response.raise_for_status()
+        data = response.json()
+        if data.get("error"):
+            raise RpcError(data["error"].get("message", str(data["error"])))
+        return data.get("result")
+
+    def block_number(self) -> int:
+        return int(self._call("eth_blockNumber", []), 16)
+
+    def safe_block_number(self, confirmations: int = BSC_LOG_CONFIRMATIONS) -> int:
+        """已有足够确认数的区块高度"""
+        return max(0, self.block_number() - confirmations)
+
+    def get_code(self, address: str, block: int) -> str:
+        return self._call("eth_getCode", [address, hex(block)]) or "0x"
+
+    def get_transfer_logs(self, token_address: str, from_block: int, to_block: int) -> List[Dict[str, Any]]:
+        return self._call("eth_getLogs", [{
+            "address": token_address,
+            "fromBlock": hex(from_block),
+            "toBlock": hex(to_block),
+            "topics": [TRANSFER_TOPIC],
+        }]) or []
+
+
+class BscHolderIndex:
+    """基于 Transfer 日志的持有者余额索引"""
+
+    def __init__(self, db: Optional[DatabaseManager] = None, rpc: Optional[BscRpcClient] = None,
+                 start_block: Optional[int] = BSC_LOG_START_BLOCK, block_range: int = BSC_LOG_BLOCK_RANGE,
+                 scheduler=None):
+        self.db = db or DatabaseManager()
+        self.rpc = rpc or BscRpcClient()
+        self.start_block = start_block
+        self.block_range = block_range
+        self.scheduler = scheduler or enrichment_scheduler
+
+    def _key(self, token_address: str) -> tuple:
+        return str(self.db.engine.url), token_address.lower()
+
+    def _sync_lock(self, token_address: str) -> threading.Lock:
+        """同一代币的同步（回填或增量）在进程内互斥"""
+        key = self._key(token_address)
+        with _state_lock:
+            return _sync_locks.setdefault(key, threading.Lock())
+
+    def is_backfilling(self, token_address: str) -> bool:
+        with _state_lock:
+            return self._key(token_address) in _backfilling
+
+    def last_block(self, token_address: str) -> Optional[int]:
+        """已处理到的区块（尚未回填时为 None）"""
+        with self.db.get_session() as session:
+            state = session.get(HolderIndexState, token_address.lower())
+            return state.last_block if state else None
+
+    def find_creation_block(self, token_address: str) -> int:
+        """二分查找合约创建区块（需要节点支持历史状态查询，失败时退回 0）"""
+        if self.start_block is not None:
+            return self.start_block
+        low, high = 0, self.rpc.block_number()
+        try:
+            if self.rpc.get_code(token_address, high) in ("0x", ""):
+                return high
+            while low < high:
+                mid = (low + high) // 2
+                if self.rpc.get_code(token_address, mid) in ("0x", ""):
+                    low = mid + 1
+                else:
+                    high = mid
+        except RpcError as e:
+            logger.warning(f"无法查找合约创建区块（节点可能不保留历史状态），从区块 0 回填: {token_address}, 错误: {e}")
+            return 0
+        return low
+
+    def sync(self, token_address: str, to_block: Optional[int] = None, blocking: bool = True) -> int:
+        """处理从上次进度（尚未回填时为合约创建区块）到 to_block（默认为已确认的最新区块）的 Transfer 日志，返回处理的日志数
+
+        同一代币同时只有一个同步；blocking=False 时若已有同步在进行则直接返回 0
+        """
+        token_address = token_address.lower()
+        lock = self._sync_lock(token_address)
+        if not lock.acquire(blocking=blocking):
+            return 0
+        try:
+            return self._sync(token_address, to_block)
+        finally:
+            lock.release()
+
+    def _sync(self, token_address: str, to_block: Optional[int]) -> int:
+        if to_block is None:
+            to_block = self.rpc.safe_block_number()
+
+        last_block = self.last_block(token_address)
+        from_block = last_block + 1 if last_block is not None else self.find_creation_block(token_address)
+
+        processed = 0
+        step = self.block_range
+        while from_block <= to_block:
+            end = min(from_block + step - 1, to_block)
+            try:
+                logs = self.rpc.get_transfer_logs(token_address, from_block, end)
+            except RpcError as e:
+                # 节点限制单次查询范围时缩小区块跨度重试；其他错误（如限流）直接抛出
+                if e.is_range_limit and step > 1:
+                    step = max(1, step // 2)
+                    continue
+                raise e
+            if not self._apply_logs(token_address, logs, from_block, end):
+                logger.info(f"{token_address} 的进度已被其他同步任务更新，停止本次同步")
+                break
+            processed += len(logs)
+            from_block = end + 1
+            # 成功后逐步恢复区块跨度，避免一段密集区块让之后的查询都很小
+            step = min(self.block_range, step * 2)
+        return processed
+
+    def _apply_logs(self, token_address: str, logs: Iterable[Dict[str, Any]], from_block: int, last_block: int) -> bool:
+        """在一个事务中累加余额变化并更新处理进度
+
+        进度以条件更新（last_block 仍为 from_block - 1）推进，并在写入余额之前执行：
+        SQLite 的写锁从该语句起持有到提交，其他进程的同步无法在检查与写入之间插入。
+        进度已不是 from_block - 1（其他进程同时同步同一代币）时回滚并返回 False
+        """
+        deltas: Dict[str, int] = {}
+        for log in logs:
+            topics = log.get("topics") or []
+            # BEP-20 Transfer 有 3 个 topic；4 个 topic 的是 NFT 转账
+            if len(topics) != 3 or topics[0].lower() != TRANSFER_TOPIC:
+                continue
+            # 只同步已确认的区块，被重组移除的日志从未计入余额
+            if log.get("removed"):
+                continue
+            sender = "0x" + topics[1][-40:].lower()
+            receiver = "0x" + topics[2][-40:].lower()
+            data = log.get("data") or "0x"
+            value = int(data, 16) if len(data) > 2 else 0
+            if not value or sender == receiver:
+                continue
+            deltas[sender] = deltas.get(sender, 0) - value
+            deltas[receiver] = deltas.get(receiver, 0) + value
+
+        with self.db.get_session() as session:
+            if not self._advance_progress(session, token_address, from_block - 1, last_block):
+                session.rollback()
+                return False
+
+            holders = list(deltas)
+            existing = {}
+            for i in range(0, len(holders), 500):
+                chunk = holders[i:i + 500]
+                rows = session.query(HolderBalance).filter(
+                    HolderBalance.token_address == token_address,
+                    HolderBalance.holder.in_(chunk),
+                )
+                for row in rows:
+                    existing[row.holder] = row
+
+            for holder, delta in deltas.items():
+                row = existing.get(holder)
+                if row is None:
+                    row = HolderBalance(token_address=token_address, holder=holder, balance="0")
+                    session.add(row)
+                balance = int(row.balance) + delta
+                row.balance = str(balance)
+                row.balance_value = float(balance)
+        return True
+
+    @staticmethod
+    def _advance_progress(session, token_address: str, expected: int, last_block: int) -> bool:
+        """把进度从 expected 推进到 last_block（尚无进度时插入），返回是否成功"""
+        updated = session.execute(
+            update(HolderIndexState)
+            .where(HolderIndexState.token_address == token_address, HolderIndexState.last_block == expected)
+            .values(last_block=last_block)
+        )
+        if updated.rowcount == 1:
+            return True
+        if session.get(HolderIndexState, token_address) is not None:
+            return False
+        inserted = session.execute(
+            sqlite_insert(HolderIndexState)
+            .values(token_address=token_address, last_block=last_block)
+            .on_conflict_do_nothing(index_elements=["token_address"])
+        )
+        return inserted.rowcount == 1
+
+    def get_concentration(self, token_address: str, top_ns: tuple = (10, 20, 50)) -> Dict[str, Optional[float]]:
+        """前 N 大持有者余额占总供应量的百分比（总供应量 = 非零地址余额之和）"""
+        token_address = token_address.lower()
+        result = {f"top{n}_pct": None for n in top_ns}
+        with self.db.get_session() as session:
+            holders = session.query(HolderBalance.balance_value).filter(
+                HolderBalance.token_address == token_address,
+                HolderBalance.holder != ZERO_ADDRESS,
+                HolderBalance.balance_value > 0,
+            )
+            total = holders.with_entities(func.sum(HolderBalance.balance_value)).scalar()
+            if not total:
+                return result
+            top = [
+                row.balance_value
+                for row in holders.order_by(HolderBalance.balance_value.desc()).limit(max(top_ns))
+            ]
+        for n in top_ns:
+            result[f"top{n}_pct"] = round(sum(top[:n]) / total * 100, 2)
+        return result
+
+    def schedule_backfill(self, token_address: str):
+        """在调度器的 backfill 通道中回填（同一代币同时只有一个回填任务）"""
+        token_address = token_address.lower()
+        key = self._key(token_address)
+        with _state_lock:
+            if key in _backfilling:
+                return
+            _backfilling.add(key)
+        future = self.scheduler.submit("bsc_rpc", "backfill", self._backfill, token_address)
+        future.add_done_callback(lambda f: self._backfill_done(token_address, f))
+
+    def _backfill(self, token_address: str) -> int:
+        processed = self.sync(token_address)
+        logger.info(f"BSC 持有者索引回填完成: {token_address}, 处理 {processed} 条日志")
+        return processed
+
+    def _backfill_done(self, token_address: str, future):
+        with _state_lock:
+            _backfilling.discard(self._key(token_address))
+        if future.exception() is not None:
+            logger.warning(f"BSC 持有者索引回填失败: {token_address}, 错误: {future.exception()}")
+
+    def get_top20_holders_pct(self, token_address: str, sync: bool = True) -> Optional[float]:
+        """与 TokenPocketAPI.get_top20_holders_pct 相同的接口
+
+        筛选时只做增量同步。尚未回填或落后超过 BSC_LOG_INLINE_MAX_BLOCKS 的代币交给后台回填，
+        本次返回现有索引的结果（尚未回填时为 None）。
+        """
+        token_address = token_address.lower()
+        last_block = self.last_block(token_address)
+        if last_block is None:
+            self.schedule_backfill(token_address)
+            return None
+        if sync and not self.is_backfilling(token_address):
+            try:
+                head = self.rpc.safe_block_number()
+                if head - last_block > BSC_LOG_INLINE_MAX_BLOCKS:
+                    self.schedule_backfill(token_address)
+                else:
+                    # 其他会话正在同步该代币时不等待，直接使用现有索引
+                    self.sync(token_address, head, blocking=False)
+            except (requests.exceptions.RequestException, RpcError) as e:
+                logger.warning(f"BSC 日志同步失败: {token_address}, 错误: {e}")
+        return self.get_concentration(token_address, (20,))["top20_pct"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回填 / 更新 BSC 代币持有者余额索引")
+    parser.add_argument("addresses", nargs="+", help="BEP-20 合约地址")
+    parser.add_argument("--rpc-url", default=BSC_RPC_URL)
+    parser.add_argument("--start-block", type=int, default=BSC_LOG_START_BLOCK, help="默认查找合约创建区块")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    index = BscHolderIndex(rpc=BscRpcClient(args.rpc_url), start_block=args.start_block)
+    for address in args.addresses:
+        processed = index.sync(address)
+        logger.info(f"{address}: 处理 {processed} 条日志, 集中度 {index.get_concentration(address)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+性能分析（可选）
+
+开启后对筛选流程的每个阶段做 cProfile + tracemalloc 分析，
+结果按运行写入 PROFILE_DIR/<run_id>/：每阶段一个 .pstats 文件，以及汇总的 summary.json。
+
+开启方式：侧边栏「性能分析」开关，或环境变量 CRYPTO_SCREENER_PROFILE=1
+"""
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from config import PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
+# 汇总中保留的热点函数 / 内存分配位置数量
+TOP_N = 15
+
+# tracemalloc 是进程全局的，Streamlit 的多个会话可能同时处于分析阶段：
+# 按引用计数启停，最后一个阶段结束时才停止（只停止由这里启动的跟踪）
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_owned = False
+
+
+def _acquire_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_owned = True
+        _tracemalloc_users += 1
+
+
+def _release_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_owned
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_owned:
+            tracemalloc.stop()
+            _tracemalloc_owned = False
+
+
+class RunProfiler:
+    """单次筛选运行的分阶段性能分析器"""
+
+    def __init__(self, output_dir: str = PROFILE_DIR, run_id: Optional[str] = None):
+        self.run_id = run_id or datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        self.run_dir = os.path.join(output_dir, self.run_id)
+        self._stats: Dict[str, pstats.Stats] = {}
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self._active_stage: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """分析一个阶段；同名阶段多次进入时结果累加"""
+        _acquire_tracemalloc()
+        try:
+            before = tracemalloc.take_snapshot()
+        except BaseException:
+            _release_tracemalloc()
+            raise
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 已有其他分析器在运行（如并发会话），本阶段只记录耗时和内存
+            profile = None
+        self._active_stage = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            if profile is not None:
+                profile.disable()
+            self._active_stage = None
+
+            try:
+                after = tracemalloc.take_snapshot()
+                # 峰值为进程全局值，并发会话时包含其他会话的分配
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                _release_tracemalloc()
+
+            if profile is not None:
+                self._merge(name, profile)
+            info = self._stages.setdefault(name, {"wall_time": 0.0, "calls": 0, "peak_memory": 0, "allocations": {}})
+            info["wall_time"] += elapsed
+            info["calls"] += 1
+            info["peak_memory"] = max(info["peak_memory"], peak)
+            # 与耗时和 pstats 一样在多次进入间累加
+            _accumulate_allocations(info["allocations"], after.compare_to(before, "lineno"))
+
+    def wrap(self, fn):
+        """包装在线程池中执行的函数，使其 CPU 开销计入当前阶段"""
+        stage = self._active_stage
+        if stage is None:
+            return fn
+
+        def wrapper(*args, **kwargs):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # 部分 Python 版本不允许多个分析器同时启用
+                return fn(*args, **kwargs)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                self._merge(stage, profile)
+
+        return wrapper
+
+    def _merge(self, name: str, profile: cProfile.Profile):
+        with self._lock:
+            if name in self._stats:
+                self._stats[name].add(profile)
+            else:
+                self._stats[name] = pstats.Stats(profile)
+
+    def summary(self) -> Dict[str, Any]:
+        """每个阶段的耗时、热点函数和内存分配位置"""
+        stages = []
+        for name, info in self._stages.items():
+            stages.append({
+                "stage": name,
+                "wall_time": round(info["wall_time"], 4),
+                "calls": info["calls"],
+                "peak_memory": info["peak_memory"],
+                "hot_functions": _top_functions(self._stats.get(name)),
+                "allocations": _top_allocations(info["allocations"]),
+            })
+        return {"run_id": self.run_id, "stages": stages}
+
+    def save(self) -> str:
+        """写入 pstats 文件和汇总，返回运行目录"""
+        os.makedirs(self.run_dir, exist_ok=True)
+        with self._lock:
+            for name, stats in self._stats.items():
+                stats.dump_stats(os.path.join(self.run_dir, f"{name}.pstats"))
+        with open(os.path.join(self.run_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        logger.info(f"性能分析结果已保存: {self.run_dir}")
+        return self.run_dir
+
+
+def _top_functions(stats: Optional[pstats.Stats], limit: int = TOP_N) -> List[Dict[str, Any]]:
+    """按自身耗时排序的热点函数"""
+    if stats is None:
+        return []
+    rows = []
+    for (filename, line, func), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            "function": f"{func} ({os.path.basename(filename)}:{line})",
+            "calls": ncalls,
+            "tottime": round(tottime, 4),
+            "cumtime": round(cumtime, 4),
+        })
+    rows.sort(key=lambda r: r["tottime"], reverse=True)
+    return rows[:limit]
+
+
+def _accumulate_allocations(totals: Dict[str, List[int]], diffs):
+    """按分配位置累加新增内存和对象数"""
+    for diff in diffs:
+        if not diff.size_diff and not diff.count_diff:
+            continue
+        frame = diff.traceback[0]
+        location = f"{os.path.basename(frame.filename)}:{frame.lineno}"
+        total = totals.setdefault(location, [0, 0])
+        total[0] += diff.size_diff
+        total[1] += diff.count_diff
+
+
+def _top_allocations(totals: Dict[str, List[int]], limit: int = TOP_N) -> List[Dict[str, Any]]:
+    """按新增内存排序的分配位置"""
+    rows = [
+        {"location": location, "size_diff": size_diff, "count_diff": count_diff}
+        for location, (size_diff, count_diff) in totals.items()
+    ]
+    # 与 compare_to 的排序一致：按变化量的绝对值
+    rows.sort(key=lambda r: abs(r["size_diff"]), reverse=True)
+    return rows[:limit]
+
+
+def load_latest_summary(output_dir: str = PROFILE_DIR) -> Optional[Dict[str, Any]]:
+    """读取最近一次运行的性能分析汇总"""
+    if not os.path.isdir(output_dir):
+        return None
+    runs = sorted(
+        d for d in os.listdir(output_dir)
+        if os.path.isfile(os.path.join(output_dir, d, "summary.json"))
+    )
+    if not runs:
+        return None
+    with open(os.path.join(output_dir, runs[-1], "summary.json"), encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,141 @@
+"""
+补充数据调度器（进程内）
+
+同一进程内的所有筛选会话共享每个上游的并发数。任务按优先级通道排队：
+- interactive: 界面上的筛选，有排队任务时总是先于后台任务执行
+- scheduled / backfill: 监控模式和批量回填，按权重分享空闲并发，且不占用为 interactive 保留的并发
+
+正在执行的任务不会被中断，“抢占”指 interactive 任务插到排队中的后台任务之前。
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Any, Callable, Optional
+
+from config import ENRICHMENT_HOST_CONCURRENCY, ENRICHMENT_LANE_WEIGHTS, ENRICHMENT_INTERACTIVE_RESERVED
+
+LANES = ("interactive", "scheduled", "backfill")
+BACKGROUND_LANES = LANES[1:]
+
+# 任务队列（多进程模式）中各通道对应的优先级，数值越大越先领取
+LANE_PRIORITIES = {"interactive": 2, "scheduled": 1, "backfill": 0}
+
+# 未配置并发数的上游
+DEFAULT_HOST_CONCURRENCY = 5
+
+
+class _HostState:
+    """单个上游的排队和执行状态"""
+
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queues = {lane: deque() for lane in LANES}
+        self.running = {lane: 0 for lane in LANES}
+        # 加权公平：每次执行后台通道的任务，该通道的 pass 增加 1 / 权重，取 pass 最小的通道
+        self.passes = {lane: 0.0 for lane in BACKGROUND_LANES}
+        self.vtime = 0.0
+        self.cond = threading.Condition()
+        self.started = False
+
+
+class EnrichmentScheduler:
+    """按上游限制并发、按优先级通道调度的线程池"""
+
+    def __init__(
+        self,
+        concurrency: Optional[Dict[str, int]] = None,
+        weights: Optional[Dict[str, float]] = None,
+        interactive_reserved: int = ENRICHMENT_INTERACTIVE_RESERVED,
+    ):
+        self.concurrency = dict(ENRICHMENT_HOST_CONCURRENCY if concurrency is None else concurrency)
+        self.weights = dict(ENRICHMENT_LANE_WEIGHTS if weights is None else weights)
+        self.interactive_reserved = interactive_reserved
+        self._hosts: Dict[str, _HostState] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, host: str, lane: str, fn: Callable, *args, **kwargs) -> Future:
+        """提交任务，返回 concurrent.futures.Future（可配合 as_completed 使用）"""
+        if lane not in LANES:
+            raise ValueError(f"未知优先级通道: {lane}")
+        state = self._host(host)
+        future = Future()
+        with state.cond:
+            queue = state.queues[lane]
+            if lane in state.passes and not queue:
+                # 空闲后重新排队的通道不能用积攒的“欠额”挤占其他通道
+                state.passes[lane] = max(state.passes[lane], state.vtime)
+            queue.append((future, fn, args, kwargs))
+            state.cond.notify()
+        return future
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各上游每个通道的排队数和执行数"""
+        result = {}
+        with self._lock:
+            hosts = list(self._hosts.values())
+        for state in hosts:
+            with state.cond:
+                result[state.name] = {
+                    "concurrency": state.concurrency,
+                    "queued": {lane: len(q) for lane, q in state.queues.items()},
+                    "running": dict(state.running),
+                }
+        return result
+
+    def _host(self, host: str) -> _HostState:
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = _HostState(host, max(1, self.concurrency.get(host, DEFAULT_HOST_CONCURRENCY)))
+                self._hosts[host] = state
+            if not state.started:
+                state.started = True
+                for i in range(state.concurrency):
+                    threading.Thread(
+                        target=self._worker, args=(state,), name=f"enrich-{host}-{i}", daemon=True
+                    ).start()
+            return state
+
+    def _next(self, state: _HostState):
+        """选出下一个要执行的任务（调用方持有 state.cond）"""
+        if state.queues["interactive"]:
+            state.running["interactive"] += 1
+            return "interactive", state.queues["interactive"].popleft()
+
+        background_running = sum(state.running[lane] for lane in BACKGROUND_LANES)
+        if background_running >= max(1, state.concurrency - self.interactive_reserved):
+            return None
+        waiting = [lane for lane in BACKGROUND_LANES if state.queues[lane]]
+        if not waiting:
+            return None
+        lane = min(waiting, key=lambda l: state.passes[l])
+        state.vtime = state.passes[lane]
+        state.passes[lane] += 1.0 / max(self.weights.get(lane, 1), 1e-9)
+        state.running[lane] += 1
+        return lane, state.queues[lane].popleft()
+
+    def _worker(self, state: _HostState):
+        while True:
+            with state.cond:
+                picked = self._next(state)
+                while picked is None:
+                    state.cond.wait()
+                    picked = self._next(state)
+            lane, (future, fn, args, kwargs) = picked
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                with state.cond:
+                    state.running[lane] -= 1
+                    # 后台任务可能因保留并发在等待
+                    state.cond.notify_all()
+
+
+# 进程内共享的调度器
+enrichment_scheduler = EnrichmentScheduler()
@@ -2,7 +2,7 @@
 代币筛选引擎 - 币安优先策略
 
 策略说明：
-1. 从币安（现货+期货）获取所有 USDT 交易对
+1. 从币安期货获取所有 USDT 永续合约，按合约元数据（exchangeInfo）剔除不可筛选的合约
 2. 筛选币安 24h 成交量 >= 阈值的代币
 3. 获取这些代币的市值数据（通过 DEXScreener）
 4. 获取 BSC 代币的前二十持有者集中度（通过 TokenPocket）
@@ -10,17 +10,27 @@
 """
 
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from concurrent.futures import as_completed
+from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 
+import numpy as np
+
 from services.tokenpocket import tp_api
 from services.binance import binance_api
 from services.dexscreener import dex_api
-from database import DatabaseManager
+from services.profiling import RunProfiler
+from services.scheduler import EnrichmentScheduler, enrichment_scheduler, LANE_PRIORITIES
+from database import DatabaseManager, JobQueue
+from config import JOB_WAIT_TIMEOUT, JOB_CLAIM_TIMEOUT, TOP_K_BATCH_SIZE, TOP_K_ESTIMATE_MARGIN, SUPPLY_INDEX_TTL, HOLDER_BACKEND
 
 logger = logging.getLogger(__name__)
 
+# 仅在补充/保存过程中使用的内部字段，不出现在筛选结果中
+INTERNAL_KEYS = ("supply_fresh", "binance_multiplier")
+
 
 @dataclass
 class FilterCriteria:
@@ -30,85 +40,277 @@ class FilterCriteria:
     min_top20_holders_pct: Optional[float] = None
     min_binance_volume: Optional[float] = None
     check_binance: bool = False
+    top_k: Optional[int] = None  # 只需要前 K 个结果时提前终止补充
+    rank_by: str = "market_cap"  # 排序字段: market_cap / binance_volume_24h
 
 
 class TokenScreener:
     """代币筛选器 - 币安优先策略"""
 
-    def __init__(self, db_manager: Optional[DatabaseManager] = None):
+    def __init__(
+        self,
+        db_manager: Optional[DatabaseManager] = None,
+        job_queue: Optional[JobQueue] = None,
+        profiler: Optional[RunProfiler] = None,
+        lane: str = "interactive",
+        scheduler: Optional[EnrichmentScheduler] = None,
+    ):
         self.db = db_manager or DatabaseManager()
+        # 设置任务队列后，补充数据交给 worker 进程（services.workers）处理
+        self.job_queue = job_queue
+        # 设置后对各阶段做性能分析
+        self.profiler = profiler
+        # 补充请求的优先级通道: interactive / scheduled / backfill（见 services.scheduler）
+        self.lane = lane
+        self.scheduler = scheduler or enrichment_scheduler
+        # HOLDER_BACKEND 为 "bsc_logs" 时按需创建（services.bsc_holders）
+        self._holder_index = None
+
+    def _stage(self, name: str):
+        """性能分析阶段（未开启分析时为空操作）"""
+        return self.profiler.stage(name) if self.profiler else nullcontext()
+
+    def _profiled(self, fn):
+        """线程池任务的 CPU 开销计入当前分析阶段"""
+        return self.profiler.wrap(fn) if self.profiler else fn
 
     def fetch_and_filter(self, criteria: FilterCriteria, fetch_top20_holders: bool = True) -> List[Dict[str, Any]]:
         """获取代币数据并根据条件筛选"""
         logger.info("开始获取代币数据（币安优先策略）...")
 
-        # 1. 从币安获取所有交易对数据
-        binance_tickers = binance_api.get_all_tickers()
-        if not binance_tickers:
-            logger.error("币安 API 获取失败")
+        with self._stage("ticker_ingest"):
+            binance_tokens = self._ingest_tickers(criteria)
+        if binance_tokens is None:
             return []
 
-        logger.info(f"币安获取到 {len(binance_tickers)} 个交易对")
+        logger.info(f"币安成交量筛选后剩余 {len(binance_tokens)} 个代币")
+
+        if criteria.top_k:
+            # 3-5. 按优先级分批补充，得到前 K 个后提前终止
+            enriched_tokens, filtered = self._fetch_top_k(binance_tokens, criteria, fetch_top20_holders)
+        else:
+            # 3. 获取市值数据
+            with self._stage("market_enrichment"):
+                enriched_tokens = self._enrich_with_market_data(binance_tokens)
+
+            # 4. 获取前二十持有者数据
+            if fetch_top20_holders and criteria.min_top20_holders_pct is not None:
+                with self._stage("holder_enrichment"):
+                    enriched_tokens = self._enrich_holders_in_cap_range(enriched_tokens, criteria)
+
+            # 5. 应用筛选条件
+            with self._stage("filter"):
+                filtered = self._apply_filters(enriched_tokens, criteria)
+
+        logger.info(f"最终筛选结果: {len(filtered)} 个代币")
+
+        # 6. 保存到数据库（保存全部已补充数据的代币，供离线筛选使用）
+        with self._stage("db_save"):
+            self._save_tokens(enriched_tokens)
+
+        return self._strip_internal(filtered)
+
+    @staticmethod
+    def _strip_internal(tokens: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """去掉内部字段（否则保存的结果和增量会因这些字段变化而出现无意义的差异）"""
+        return [{k: v for k, v in token.items() if k not in INTERNAL_KEYS} for token in tokens]
+
+    def _ingest_tickers(self, criteria: FilterCriteria, refresh: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """获取币安交易对并按成交量初筛，API 失败时返回 None"""
+        # 1. 从币安获取可筛选的交易对（已按合约元数据剔除非交易、交割、指数合约）
+        universe = binance_api.get_universe(refresh=refresh)
+        if not universe:
+            logger.error("币安 API 获取失败")
+            return None
+
+        logger.info(f"币安获取到 {len(universe)} 个交易对")
 
         # 2. 筛选币安成交量 >= 阈值的代币
         min_binance_vol = criteria.min_binance_volume if criteria.check_binance else 0
         binance_tokens = []
 
-        for symbol, ticker in binance_tickers.items():
-            if not symbol.endswith("USDT"):
-                continue
-
+        for item in universe:
+            ticker = item["ticker"]
             volume_24h = float(ticker.get("quoteVolume", 0) or 0)
             if min_binance_vol > 0 and volume_24h < min_binance_vol:
                 continue
 
-            token_symbol = symbol.replace("USDT", "").replace("USD", "")
+            # 1000PEPE 等合约的价格对应 multiplier 个代币，换算为单个代币的价格
+            multiplier = item["multiplier"]
             binance_tokens.append({
-                "symbol": token_symbol,
-                "binance_symbol": symbol,
+                "symbol": item["symbol"],
+                "binance_symbol": item["binance_symbol"],
+                "binance_multiplier": multiplier,
                 "binance_volume_24h": volume_24h,
-                "binance_price": float(ticker.get("lastPrice", 0) or 0),
+                "binance_price": float(ticker.get("lastPrice", 0) or 0) / multiplier,
                 "binance_price_change": float(ticker.get("priceChangePercent", 0) or 0),
             })
 
-        logger.info(f"币安成交量筛选后剩余 {len(binance_tokens)} 个代币")
-
-        # 3. 获取市值数据
-        enriched_tokens = self._enrich_with_market_data(binance_tokens)
-
-        # 4. 获取前二十持有者数据
-        if fetch_top20_holders and criteria.min_top20_holders_pct is not None:
-            enriched_tokens = self._enrich_with_top20_holders(enriched_tokens)
+        return binance_tokens
+
+    def _fetch_top_k(
+        self,
+        tokens: List[Dict[str, Any]],
+        criteria: FilterCriteria,
+        fetch_top20_holders: bool,
+    ) -> tuple:
+        """按优先级分批补充数据，已有 K 个结果且剩余候选不可能排得更高时停止
+
+        返回 (已补充的代币, 前 K 个筛选结果)
+        """
+        rank_by = criteria.rank_by
+        bounds = self._rank_upper_bounds(tokens, criteria)
+        candidates = sorted(tokens, key=lambda t: bounds[id(t)], reverse=True)
+
+        enriched_tokens, passed = [], []
+        for start in range(0, len(candidates), TOP_K_BATCH_SIZE):
+            batch = candidates[start:start + TOP_K_BATCH_SIZE]
+            with self._stage("market_enrichment"):
+                batch = self._enrich_with_market_data(batch)
+            if fetch_top20_holders and criteria.min_top20_holders_pct is not None:
+                with self._stage("holder_enrichment"):
+                    batch = self._enrich_holders_in_cap_range(batch, criteria)
+            enriched_tokens.extend(batch)
+            with self._stage("filter"):
+                passed.extend(self._apply_filters(batch, criteria))
+
+            remaining = candidates[start + TOP_K_BATCH_SIZE:]
+            if len(passed) >= criteria.top_k and remaining:
+                passed.sort(key=lambda x: x.get(rank_by) or 0, reverse=True)
+                kth_value = passed[criteria.top_k - 1].get(rank_by) or 0
+                if bounds[id(remaining[0])] <= kth_value:
+                    logger.info(f"已得到前 {criteria.top_k} 个结果，跳过剩余 {len(remaining)} 个候选")
+                    break
+
+        passed.sort(key=lambda x: x.get(rank_by) or 0, reverse=True)
+        return enriched_tokens, passed[:criteria.top_k]
+
+    def _rank_upper_bounds(self, tokens: List[Dict[str, Any]], criteria: FilterCriteria) -> Dict[int, float]:
+        """估计每个候选代币排序字段可能达到的上界"""
+        if criteria.rank_by == "binance_volume_24h":
+            # 币安成交量已知，即为精确值
+            return {id(t): t.get("binance_volume_24h") or 0 for t in tokens}
+
+        # 市值：用数据库中缓存的市值按币安价格变化折算，并留出误差余量；无缓存时上界为筛选上限
+        estimates = self.db.get_market_cap_estimates([t["binance_symbol"] for t in tokens])
+        bounds = {}
+        for token in tokens:
+            cached = estimates.get(token["binance_symbol"])
+            bound = criteria.max_market_cap
+            if cached and cached.get("market_cap"):
+                estimate = cached["market_cap"]
+                if cached.get("price") and token.get("binance_price"):
+                    estimate *= token["binance_price"] / cached["price"]
+                bound = min(bound, estimate * (1 + TOP_K_ESTIMATE_MARGIN))
+            bounds[id(token)] = bound
+        return bounds
 
-        # 5. 应用筛选条件
-        filtered = self._apply_filters(enriched_tokens, criteria)
+    def _enrich_with_market_data(self, tokens: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """为币安代币补充市值数据（供应量索引命中的代币本地计算，其余查询 DEXScreener）"""
+        indexed, tokens = self._apply_supply_index(tokens)
+        logger.info(f"供应量索引命中 {len(indexed)} 个，正在获取 {len(tokens)} 个代币的市值数据...")
+        if self.job_queue is not None:
+            queued = self._enrich_market_via_queue(tokens)
+            if queued is not None:
+                return indexed + queued
+
+        enriched = indexed
+
+        fn = self._profiled(self._get_market_data_for_token)
+        futures = {self.scheduler.submit("dexscreener", self.lane, fn, token): token for token in tokens}
+        for future in as_completed(futures):
+            token = futures[future]
+            try:
+                result = future.result()
+                if result:
+                    enriched.append(result)
+            except Exception:
+                token["market_cap"] = None
+                token["chain"] = "unknown"
+                enriched.append(token)
 
-        logger.info(f"最终筛选结果: {len(filtered)} 个代币")
+        return enriched
 
-        # 6. 保存到数据库
-        self._save_tokens(filtered)
+    def _apply_supply_index(self, tokens: List[Dict[str, Any]]) -> tuple:
+        """用供应量索引本地计算市值：市值 = 币安价格 × 供应量
 
-        return filtered
+        返回 (已计算市值的代币, 未命中或已过期需查询上游的代币)
+        """
+        if not tokens:
+            return [], []
+        index = self.db.get_supply_index([t["binance_symbol"] for t in tokens if t.get("binance_symbol")])
+        fresh_after = datetime.utcnow() - timedelta(seconds=SUPPLY_INDEX_TTL)
 
-    def _enrich_with_market_data(self, tokens: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """为币安代币补充市值数据"""
-        logger.info(f"正在获取 {len(tokens)} 个代币的市值数据...")
+        hits, misses = [], []
+        for token in tokens:
+            entry = index.get(token.get("binance_symbol"))
+            if entry and entry["supply"] and entry["supply_updated_at"] and entry["supply_updated_at"] >= fresh_after:
+                hits.append((token, entry))
+            else:
+                misses.append(token)
+        if not hits:
+            return [], misses
+
+        prices = np.array([token.get("binance_price") or 0.0 for token, _ in hits], dtype=float)
+        supplies = np.array([entry["supply"] for _, entry in hits], dtype=float)
+        market_caps = prices * supplies
+
+        indexed = []
+        for (token, entry), market_cap in zip(hits, market_caps.tolist()):
+            token["market_cap"] = market_cap if market_cap > 0 else None
+            token["supply"] = entry["supply"]
+            token["chain"] = entry["chain"] or "unknown"
+            token["address"] = entry["address"]
+            token["name"] = entry["name"] or token.get("symbol")
+            token["price"] = token.get("binance_price")
+            # 未查询 DEXScreener，沿用上次获取的成交量和涨跌幅，避免保存时被空值覆盖
+            token["volume"] = entry["volume_24h"]
+            token["chg_24h"] = entry["price_change_24h"]
+            indexed.append(token)
+        return indexed, misses
+
+    def _enrich_holders_in_cap_range(self, tokens: List[Dict[str, Any]], criteria: FilterCriteria) -> List[Dict[str, Any]]:
+        """只为市值满足条件的代币获取持仓数据，其余代币不可能通过筛选"""
+        in_range, out_of_range = [], []
+        for token in tokens:
+            market_cap = token.get("market_cap")
+            if market_cap is not None and criteria.min_market_cap <= market_cap <= criteria.max_market_cap:
+                in_range.append(token)
+            else:
+                out_of_range.append(token)
+        return self._enrich_with_top20_holders(in_range) + out_of_range
+
+    def _enrich_market_via_queue(self, tokens: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """通过任务队列由 worker 进程补充市值数据（没有 worker 在运行时返回 None）"""
+        items = self._run_queue_jobs("market", tokens)
+        if items is None:
+            return None
         enriched = []
+        for item in items:
+            if item["status"] == "done" and item["result"]:
+                enriched.append(item["result"])
+            else:
+                token = item["payload"]
+                token["market_cap"] = None
+                token["chain"] = "unknown"
+                enriched.append(token)
+        return enriched
 
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = {executor.submit(self._get_market_data_for_token, token): token for token in tokens}
-            for future in as_completed(futures):
-                token = futures[future]
-                try:
-                    result = future.result()
-                    if result:
-                        enriched.append(result)
-                except Exception:
-                    token["market_cap"] = None
-                    token["chain"] = "unknown"
-                    enriched.append(token)
+    def _run_queue_jobs(self, kind: str, tokens: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """写入任务队列并等待 worker 完成
 
-        return enriched
+        JOB_CLAIM_TIMEOUT 内没有任何任务被领取时撤销本批任务并返回 None，由调用方在当前进程内补充
+        """
+        if not tokens:
+            return []
+        run_id = self.job_queue.enqueue(kind, tokens, [LANE_PRIORITIES[self.lane]] * len(tokens))
+        if not self.job_queue.wait(run_id, timeout=JOB_WAIT_TIMEOUT, claim_timeout=JOB_CLAIM_TIMEOUT):
+            if not self.job_queue.claimed(run_id):
+                self.job_queue.cancel(run_id)
+                logger.warning(f"{JOB_CLAIM_TIMEOUT} 秒内没有 worker 领取任务: {kind}, 改为在当前进程内补充")
+                return None
+            logger.warning(f"队列任务等待超时: {kind}, 未完成的代币按失败处理")
+        return self.job_queue.collect(run_id)
 
     def _get_market_data_for_token(self, token: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """获取单个代币的市值数据"""
@@ -127,6 +329,10 @@ class TokenScreener:
                     best_pair = max(pairs, key=lambda p: float(p.get("fdv") or 0))
 
                 parsed = dex_api.parse_pair_data(best_pair)
+                # 记录供应量（FDV / 价格），之后可用币安价格在本地计算市值
+                if parsed.get("market_cap") and parsed.get("price"):
+                    token["supply"] = float(parsed["market_cap"]) / parsed["price"]
+                    token["supply_fresh"] = True
                 token["market_cap"] = parsed.get("market_cap")
                 token["chain"] = parsed.get("chain", "unknown")
                 token["address"] = parsed.get("address", "")
@@ -155,15 +361,26 @@ class TokenScreener:
         for token in other_tokens:
             token["top20_holders_pct"] = None
 
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = {executor.submit(self._get_top20_for_token, token): token for token in bsc_tokens}
-            for future in as_completed(futures):
-                token = futures[future]
-                try:
-                    token["top20_holders_pct"] = future.result()
-                except Exception:
-                    token["top20_holders_pct"] = None
+        items = self._run_queue_jobs("holders", bsc_tokens) if self.job_queue is not None else None
+        if items is not None:
+            for item in items:
+                token = item["payload"]
+                result = item["result"] or {}
+                token["top20_holders_pct"] = result.get("top20_holders_pct")
                 enriched.append(token)
+            enriched.extend(other_tokens)
+            return enriched
+
+        host = "bsc_rpc" if HOLDER_BACKEND == "bsc_logs" else "tokenpocket"
+        fn = self._profiled(self._get_top20_for_token)
+        futures = {self.scheduler.submit(host, self.lane, fn, token): token for token in bsc_tokens}
+        for future in as_completed(futures):
+            token = futures[future]
+            try:
+                token["top20_holders_pct"] = future.result()
+            except Exception:
+                token["top20_holders_pct"] = None
+            enriched.append(token)
 
         enriched.extend(other_tokens)
         return enriched
@@ -176,38 +393,51 @@ class TokenScreener:
         if not address or not symbol:
             return None
 
+        if HOLDER_BACKEND == "bsc_logs":
+            return self._get_holder_index().get_top20_holders_pct(address)
+
         try:
             return tp_api.get_top20_holders_pct(address, symbol)
         except Exception:
             return None
 
+    def _get_holder_index(self):
+        """本地持有者余额索引（基于 BSC Transfer 日志）"""
+        if self._holder_index is None:
+            from services.bsc_holders import BscHolderIndex
+            self._holder_index = BscHolderIndex(self.db)
+        return self._holder_index
+
     def _apply_filters(self, tokens: List[Dict[str, Any]], criteria: FilterCriteria) -> List[Dict[str, Any]]:
         """应用筛选条件"""
-        filtered = []
-
-        for token in tokens:
-            market_cap = token.get("market_cap")
-            if market_cap is None:
-                continue
-            if market_cap < criteria.min_market_cap or market_cap > criteria.max_market_cap:
-                continue
+        filtered = [token for token in tokens if self._passes_filters(token, criteria)]
+        filtered.sort(key=lambda x: x.get("market_cap", 0) or 0, reverse=True)
+        return filtered
 
-            if criteria.min_top20_holders_pct is not None:
-                top20_pct = token.get("top20_holders_pct")
-                if top20_pct is None or top20_pct < criteria.min_top20_holders_pct:
-                    continue
+    @staticmethod
+    def _passes_filters(token: Dict[str, Any], criteria: FilterCriteria) -> bool:
+        """单个代币是否满足筛选条件"""
+        market_cap = token.get("market_cap")
+        if market_cap is None:
+            return False
+        if market_cap < criteria.min_market_cap or market_cap > criteria.max_market_cap:
+            return False
 
-            filtered.append(token)
+        if criteria.min_top20_holders_pct is not None:
+            top20_pct = token.get("top20_holders_pct")
+            if top20_pct is None or top20_pct < criteria.min_top20_holders_pct:
+                return False
 
-        filtered.sort(key=lambda x: x.get("market_cap", 0) or 0, reverse=True)
-        return filtered
+        return True
 
     def _save_tokens(self, tokens: List[Dict[str, Any]]):
         """保存代币到数据库"""
         try:
             db_tokens = []
             for token in tokens:
-                db_tokens.append({
+                if not token.get("address"):
+                    continue
+                db_token = {
                     "address": token.get("address", ""),
                     "symbol": token.get("symbol", ""),
                     "name": token.get("name", ""),
@@ -217,8 +447,18 @@ class TokenScreener:
                     "holders": token.get("holder_count"),
                     "price": token.get("price"),
                     "price_change_24h": token.get("chg_24h"),
-                })
-            self.db.bulk_upsert_tokens(db_tokens)
+                    "binance_symbol": token.get("binance_symbol"),
+                    "binance_volume_24h": token.get("binance_volume_24h"),
+                }
+                # 本次未获取持仓数据时保留数据库中的旧值
+                if "top20_holders_pct" in token:
+                    db_token["top20_holders_pct"] = token["top20_holders_pct"]
+                # 仅在本次从上游得到供应量时更新供应量索引
+                if token.get("supply_fresh"):
+                    db_token["supply"] = token["supply"]
+                    db_token["supply_updated_at"] = datetime.utcnow()
+                db_tokens.append(db_token)
+            self.db.submit_tokens(db_tokens)
         except Exception as e:
             logger.error(f"保存代币数据失败: {e}")
 
@@ -229,6 +469,8 @@ def create_filter_criteria(
     min_top20_holders_pct: float = None,
     min_binance_volume: float = None,
     check_binance: bool = False,
+    top_k: int = None,
+    rank_by: str = "market_cap",
 ) -> FilterCriteria:
     """创建筛选条件对象"""
     return FilterCriteria(
@@ -237,4 +479,6 @@ def create_filter_criteria(
         min_top20_holders_pct=min_top20_holders_pct,
         min_binance_volume=min_binance_volume,
         check_binance=check_binance,
+        top_k=top_k or None,
+        rank_by=rank_by,
     )
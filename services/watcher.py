@@ -0,0 +1,303 @@
+"""
+持续监控模式
+
+每个周期刷新币安行情，只为输入明显变化或缓存过期的代币重新补充数据，
+增量地重新评估筛选条件，并将代币进入/移出筛选结果的事件发送到 webhook、文件或界面。
+
+启动命令: python -m services.watcher --interval 60 --file events.jsonl
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+import requests
+
+from config import (
+    REQUEST_TIMEOUT,
+    WATCH_INTERVAL,
+    WATCH_PRICE_CHANGE_THRESHOLD,
+    WATCH_MARKET_TTL,
+    WATCH_HOLDERS_TTL,
+)
+from services.screener import TokenScreener, FilterCriteria, create_filter_criteria
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookSink:
+    """将事件 POST 到本地 webhook"""
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def emit(self, events: List[Dict[str, Any]]):
+        try:
+            requests.post(self.url, json={"events": events}, timeout=REQUEST_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"webhook 发送失败: {self.url}, 错误: {e}")
+
+
+class FileSink:
+    """将事件以 JSON Lines 追加写入文件"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def emit(self, events: List[Dict[str, Any]]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+
+
+class MemorySink:
+    """保存最近的事件，供界面展示（监控线程写入，界面线程读取）"""
+
+    def __init__(self, maxlen: int = 200):
+        self.events = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def emit(self, events: List[Dict[str, Any]]):
+        with self._lock:
+            self.events.extend(events)
+
+    def recent(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(reversed(self.events))
+
+
+class TokenWatcher:
+    """增量监控筛选条件"""
+
+    def __init__(self, criteria: FilterCriteria, sinks: Optional[list] = None,
+                 screener: Optional[TokenScreener] = None):
+        self.criteria = criteria
+        self.sinks = sinks or []
+        # 监控是后台任务，补充请求走 scheduled 通道，不阻塞界面上的筛选
+        self.screener = screener or TokenScreener(lane="scheduled")
+        self._cache: Dict[str, Dict[str, Any]] = {}  # binance_symbol -> {"token", "market_at", "holders_at"}
+        self._matching: Dict[str, Dict[str, Any]] = {}  # 满足筛选条件的代币
+        self._passing: Dict[str, Dict[str, Any]] = {}  # 当前筛选结果（设置 top_k 时为排名前 K 的代币）
+        self._lock = threading.Lock()
+        self.ticks = 0
+        self.last_tick_stats: Dict[str, Any] = {}
+        self.last_seen = time.time()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def passing(self) -> List[Dict[str, Any]]:
+        """当前满足条件的代币（按市值降序）"""
+        with self._lock:
+            tokens = list(self._passing.values())
+        return sorted(tokens, key=lambda x: x.get("market_cap", 0) or 0, reverse=True)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def touch(self):
+        """记录仍有使用者（界面会话）在关注，配合 idle_timeout 使用"""
+        self.last_seen = time.time()
+
+    def tick(self) -> List[Dict[str, Any]]:
+        """执行一个监控周期，返回本周期产生的事件"""
+        now = time.time()
+        universe = self.screener._ingest_tickers(self.criteria, refresh=True)
+        if universe is None:
+            return []
+
+        need_market, need_holders, dirty = [], [], []
+        for fresh in universe:
+            key = fresh["binance_symbol"]
+            entry = self._cache.get(key)
+            if entry is None or self._market_stale(entry, fresh, now):
+                need_market.append(fresh)
+                continue
+
+            # 行情字段直接更新，无需重新请求上游
+            token = entry["token"]
+            if (token.get("binance_volume_24h"), token.get("binance_price")) != (
+                fresh["binance_volume_24h"], fresh["binance_price"]
+            ):
+                token.update(fresh)
+                if token.get("supply"):
+                    # 已知供应量时直接用最新币安价格本地计算市值
+                    token["market_cap"] = token["binance_price"] * token["supply"]
+                dirty.append(key)
+            if self._needs_holders(token) and now - entry.get("holders_at", 0) > WATCH_HOLDERS_TTL:
+                need_holders.append(token)
+
+        if need_market:
+            for token in self.screener._enrich_with_market_data(need_market):
+                key = token["binance_symbol"]
+                old = self._cache.get(key)
+                holders_at = 0
+                # 合约地址未变时沿用未过期的持仓数据
+                if old and old["token"].get("address") == token.get("address") and "top20_holders_pct" in old["token"]:
+                    token["top20_holders_pct"] = old["token"]["top20_holders_pct"]
+                    holders_at = old["holders_at"]
+                self._cache[key] = {"token": token, "market_at": now, "holders_at": holders_at}
+                dirty.append(key)
+                if self._needs_holders(token) and now - holders_at > WATCH_HOLDERS_TTL:
+                    need_holders.append(token)
+
+        if need_holders and self.criteria.min_top20_holders_pct is not None:
+            for token in self.screener._enrich_with_top20_holders(need_holders):
+                self._cache[token["binance_symbol"]]["holders_at"] = now
+                dirty.append(token["binance_symbol"])
+
+        # 增量评估：只重新判断数据有变化的代币，以及已不在币安成交量范围内的代币
+        in_universe = {t["binance_symbol"] for t in universe}
+        for key in list(self._matching):
+            if key not in in_universe:
+                del self._matching[key]
+        for key in set(dirty):
+            token = self._cache[key]["token"]
+            if self.screener._passes_filters(token, self.criteria):
+                self._matching[key] = token
+            else:
+                self._matching.pop(key, None)
+
+        # 与界面筛选一致：设置 top_k 时只有按 rank_by 排名前 K 的代币算作进入结果
+        passing = self._rank(self._matching)
+        events = []
+        with self._lock:
+            for key in list(self._passing):
+                if key not in passing:
+                    events.append(self._event("exit", self._passing.pop(key)))
+            for key, token in passing.items():
+                if key not in self._passing:
+                    events.append(self._event("enter", token))
+                self._passing[key] = token
+
+        if need_market or need_holders:
+            self.screener._save_tokens(need_market + need_holders)
+
+        self.ticks += 1
+        self.last_tick_stats = {
+            "universe": len(universe),
+            "market_lookups": len(need_market),
+            "holder_lookups": len(need_holders),
+            "evaluated": len(set(dirty)),
+            "events": len(events),
+        }
+        logger.info(f"监控周期 {self.ticks}: {self.last_tick_stats}")
+
+        if events:
+            for sink in self.sinks:
+                try:
+                    sink.emit(events)
+                except Exception as e:
+                    logger.warning(f"事件输出失败: {e}")
+        return events
+
+    def run(self, interval: float = WATCH_INTERVAL, stop_event: Optional[threading.Event] = None,
+            max_ticks: Optional[int] = None, idle_timeout: Optional[float] = None):
+        """按固定间隔循环执行监控周期；设置 idle_timeout 时，超过该时长未 touch() 则自动停止"""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            if idle_timeout is not None and time.time() - self.last_seen > idle_timeout:
+                logger.info("监控已无人关注，停止")
+                break
+            started = time.time()
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"监控周期失败: {e}")
+            if max_ticks is not None and self.ticks >= max_ticks:
+                break
+            stop_event.wait(max(0.0, interval - (time.time() - started)))
+
+    def start(self, interval: float = WATCH_INTERVAL, idle_timeout: Optional[float] = None) -> threading.Event:
+        """在后台线程运行，返回用于停止的 Event"""
+        stop_event = threading.Event()
+        self.touch()
+        self._thread = threading.Thread(target=self.run, args=(interval, stop_event, None, idle_timeout), daemon=True)
+        self._thread.start()
+        return stop_event
+
+    def _market_stale(self, entry: Dict[str, Any], fresh: Dict[str, Any], now: float) -> bool:
+        """市值数据是否需要重新获取：缓存过期，或（未知供应量时）币安价格变动超过阈值"""
+        if now - entry["market_at"] > WATCH_MARKET_TTL:
+            return True
+        if entry["token"].get("supply"):
+            return False
+        old_price = entry["token"].get("binance_price") or 0
+        if not old_price:
+            return True
+        return abs(fresh["binance_price"] / old_price - 1) > WATCH_PRICE_CHANGE_THRESHOLD
+
+    def _needs_holders(self, token: Dict[str, Any]) -> bool:
+        """与筛选流程一致：只为市值在范围内的 BSC 代币获取持仓数据"""
+        market_cap = token.get("market_cap")
+        return (
+            self.criteria.min_top20_holders_pct is not None
+            and token.get("chain", "").lower() in ["bsc", "bnbchain"]
+            and market_cap is not None
+            and self.criteria.min_market_cap <= market_cap <= self.criteria.max_market_cap
+        )
+
+    def _rank(self, matching: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """按筛选条件的 top_k / rank_by 取当前结果"""
+        if not self.criteria.top_k:
+            return dict(matching)
+        rank_by = self.criteria.rank_by
+        ranked = sorted(matching.items(), key=lambda item: item[1].get(rank_by) or 0, reverse=True)
+        return dict(ranked[:self.criteria.top_k])
+
+    @staticmethod
+    def _event(kind: str, token: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "type": kind,
+            "symbol": token.get("symbol"),
+            "binance_symbol": token.get("binance_symbol"),
+            "address": token.get("address"),
+            "market_cap": token.get("market_cap"),
+            "top20_holders_pct": token.get("top20_holders_pct"),
+            "binance_volume_24h": token.get("binance_volume_24h"),
+            "at": datetime.now().isoformat(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="筛选条件持续监控")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="监控周期（秒）")
+    parser.add_argument("--min-cap", type=float, default=10_000_000)
+    parser.add_argument("--max-cap", type=float, default=300_000_000)
+    parser.add_argument("--min-top20", type=float, default=None)
+    parser.add_argument("--min-volume", type=float, default=3_000_000)
+    parser.add_argument("--top-k", type=int, default=None, help="只监控排名前 K 的代币")
+    parser.add_argument("--rank-by", default="market_cap", choices=["market_cap", "binance_volume_24h"])
+    parser.add_argument("--webhook", help="事件 webhook 地址")
+    parser.add_argument("--file", help="事件输出文件（JSON Lines）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    sinks = []
+    if args.webhook:
+        sinks.append(WebhookSink(args.webhook))
+    if args.file:
+        sinks.append(FileSink(args.file))
+
+    criteria = create_filter_criteria(
+        min_market_cap=args.min_cap,
+        max_market_cap=args.max_cap,
+        min_top20_holders_pct=args.min_top20,
+        min_binance_volume=args.min_volume,
+        check_binance=True,
+        top_k=args.top_k,
+        rank_by=args.rank_by,
+    )
+    try:
+        TokenWatcher(criteria, sinks).run(args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
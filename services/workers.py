@@ -0,0 +1,105 @@
+"""
+代币数据补充 worker 进程
+
+从 SQLite 任务队列领取补充任务，遵守跨进程共享限流，结果写回队列。
+
+启动命令: python -m services.workers --processes 4
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import socket
+import time
+from typing import Optional
+
+from config import DATABASE_URL, HOLDER_BACKEND
+from database import DatabaseManager, JobQueue, SharedRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# 任务类型对应的上游 API（限流桶名称）
+JOB_RATE_LIMIT_KEYS = {
+    "market": "dexscreener",
+    "holders": "bsc_rpc" if HOLDER_BACKEND == "bsc_logs" else "tokenpocket",
+}
+
+
+def process_job(screener, job) -> dict:
+    """执行单个补充任务，返回写回队列的结果"""
+    token = dict(job.payload)
+    if job.kind == "market":
+        return screener._get_market_data_for_token(token)
+    if job.kind == "holders":
+        return {"top20_holders_pct": screener._get_top20_for_token(token)}
+    raise ValueError(f"未知任务类型: {job.kind}")
+
+
+def run_worker(db_url: str = DATABASE_URL, batch_size: int = 5, idle_sleep: float = 1.0,
+               max_idle: Optional[float] = None):
+    """worker 主循环：领取任务 -> 限流 -> 执行 -> 写回"""
+    from services.screener import TokenScreener
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    db = DatabaseManager(db_url)
+    queue = JobQueue(db)
+    limiter = SharedRateLimiter(db)
+    screener = TokenScreener(db)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    idle_since = time.time()
+
+    logger.info(f"worker {worker_id} 已启动")
+    while True:
+        jobs = queue.claim(worker_id, limit=batch_size)
+        if not jobs:
+            if max_idle is not None and time.time() - idle_since >= max_idle:
+                break
+            time.sleep(idle_sleep)
+            continue
+
+        idle_since = time.time()
+        for job in jobs:
+            limit_key = JOB_RATE_LIMIT_KEYS.get(job.kind)
+            if limit_key:
+                limiter.acquire(limit_key)
+            try:
+                completed = queue.complete(job.id, process_job(screener, job), job.lease_owner)
+            except Exception as e:
+                logger.warning(f"任务 {job.id} 失败: {e}")
+                completed = queue.fail(job.id, str(e), job.lease_owner)
+            if not completed:
+                logger.warning(f"任务 {job.id} 的租约已过期并被重新领取，丢弃本次结果")
+
+    logger.info(f"worker {worker_id} 空闲退出")
+
+
+def start_workers(processes: int, db_url: str = DATABASE_URL, **kwargs) -> list:
+    """启动多个 worker 进程"""
+    ctx = multiprocessing.get_context("spawn")
+    workers = []
+    for _ in range(processes):
+        p = ctx.Process(target=run_worker, args=(db_url,), kwargs=kwargs, daemon=True)
+        p.start()
+        workers.append(p)
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="代币数据补充 worker")
+    parser.add_argument("--processes", "-n", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--db-url", default=DATABASE_URL)
+    args = parser.parse_args()
+
+    workers = start_workers(args.processes, args.db_url, batch_size=args.batch_size)
+    try:
+        for p in workers:
+            p.join()
+    except KeyboardInterrupt:
+        for p in workers:
+            p.terminate()
+
+
+if __name__ == "__main__":
+    main()